@@ -1,30 +1,68 @@
 import os
 import json
-from datasets import Dataset
+import time
+import shutil
+import hashlib
+from itertools import chain
+from datasets import Dataset, load_from_disk
 from transformers import AutoTokenizer
+try:
+    import resource  # Peak memory reporting (not available on Windows)
+except ImportError:
+    resource = None
 
 # --- Configuration ---
-CONLL_FILE = 'labeled_data_15_papers.conll' 
+CONLL_FILE = 'labeled_data_15_papers.conll'
 OUTPUT_DIR = 'data'
 MODEL_CHECKPOINT = "distilbert-base-uncased"  # Match the trainer script
+CACHE_DIR = 'processing_cache'  # Content-addressed cache of parsed + tokenized datasets
+PROCESSING_VERSION = 2  # Bump when parsing/tokenization logic changes to invalidate the cache
+NUM_PROC = int(os.getenv('TOKENIZE_NUM_PROC', os.cpu_count() or 1))
+MIN_SENTENCES_PER_PROC = 2000  # Below this, worker start-up costs more than it saves
 
 
-def get_iob_tags_from_conll(file_path):
+def iter_conll_sentences(file_path, tag_collector=None):
     """
-    Reads the CoNLL file and extracts unique IOB tags (e.g., B-Methodology, I-Dataset, O).
+    Streams sentences from a CoNLL file in a single pass.
+
+    Yields {'tokens': [...], 'ner_tags': [...]} per sentence so the corpus never has to
+    fit in memory. If `tag_collector` (a set) is given, every IOB tag seen is added to it
+    while streaming, so the label set comes out of the same pass.
     """
-    tags = set()
+    current_tokens = []
+    current_tags = []
     with open(file_path, 'r', encoding='utf-8') as f:
         for line in f:
             line = line.strip()
-            if line and not line.startswith('-DOCSTART-'):
+            if not line or line.startswith('-DOCSTART-'):
+                if current_tokens:
+                    yield {'tokens': current_tokens, 'ner_tags': current_tags}
+                current_tokens = []
+                current_tags = []
+            else:
                 parts = line.split()
                 if len(parts) == 2:
-                    tags.add(parts[1])
-    # Ensure 'O' (Outside) is always included
-    if 'O' not in tags:
-        tags.add('O')
-    return sorted(list(tags))  # sorted for consistent mapping
+                    current_tokens.append(parts[0])
+                    current_tags.append(parts[1])
+                    if tag_collector is not None:
+                        tag_collector.add(parts[1])
+    if current_tokens:
+        yield {'tokens': current_tokens, 'ner_tags': current_tags}
+
+
+def finalize_tag_names(tags):
+    """Ensures 'O' (Outside) is included and returns the tags sorted for a consistent mapping."""
+    return sorted(set(tags) | {'O'})
+
+
+def get_iob_tags_from_conll(file_path):
+    """
+    Reads the CoNLL file and extracts unique IOB tags (e.g., B-Methodology, I-Dataset, O).
+    """
+    tags = set()
+    for _ in iter_conll_sentences(file_path, tag_collector=tags):
+        pass
+    return finalize_tag_names(tags)
 
 
 def tokenize_and_align_labels(examples, tokenizer, label_to_id):
@@ -54,6 +92,39 @@ def tokenize_and_align_labels(examples, tokenizer, label_to_id):
     return tokenized_inputs
 
 
+def compute_cache_key(file_path):
+    """
+    Content hash of the CoNLL file plus everything that affects the processed output,
+    so any change to the data, tokenizer or processing logic produces a new cache entry.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{MODEL_CHECKPOINT}|v{PROCESSING_VERSION}|".encode('utf-8'))
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def load_processing_cache(cache_path):
+    """Returns (tokenized DatasetDict, id_to_label) from a previous run, or None on a cache miss."""
+    labels_path = os.path.join(cache_path, 'labels.json')
+    datasets_path = os.path.join(cache_path, 'tokenized')
+    if not (os.path.exists(labels_path) and os.path.exists(datasets_path)):
+        return None
+    with open(labels_path, 'r') as f:
+        id_to_label = {int(k): v for k, v in json.load(f).items()}
+    return load_from_disk(datasets_path), id_to_label
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process and its (tokenization) workers, in MB."""
+    if resource is None:
+        return None
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (self_kb + children_kb) / 1024  # ru_maxrss is reported in KB on Linux
+
+
 if __name__ == '__main__':
     print("--- Phase II, Step 3: Data Processing Started ---")
 
@@ -63,64 +134,86 @@ if __name__ == '__main__':
         exit()
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
+    run_start = time.perf_counter()
+
+    # 1. Check the content-hash cache: unchanged inputs skip parsing and tokenization
+    cache_key = compute_cache_key(CONLL_FILE)
+    cache_path = os.path.join(CACHE_DIR, cache_key)
+    cached = load_processing_cache(cache_path)
+
+    if cached:
+        tokenized_datasets, id_to_label = cached
+        tag_names = [id_to_label[i] for i in sorted(id_to_label)]
+        print(f"Cache hit ({cache_key}): skipping parsing and tokenization.")
+    else:
+        # 2. Stream the CoNLL file once: sentences go to Arrow on disk, tags are collected on the way
+        parse_start = time.perf_counter()
+        seen_tags = set()
+        try:
+            raw_datasets = Dataset.from_generator(
+                iter_conll_sentences,
+                gen_kwargs={'file_path': CONLL_FILE, 'tag_collector': seen_tags},
+                cache_dir=os.path.join(cache_path, 'raw'),
+            )
+        except Exception as e:
+            print(f"FATAL ERROR: Failed to load and parse the CoNLL file. Check file format: {e}")
+            exit()
+        if not seen_tags:
+            # The generator output was reused from the datasets cache; recover tags from the Arrow data
+            for batch in raw_datasets.iter(batch_size=10000):
+                seen_tags.update(chain.from_iterable(batch['ner_tags']))
+        parse_seconds = time.perf_counter() - parse_start
+
+        tag_names = finalize_tag_names(seen_tags)
+        id_to_label = {i: tag for i, tag in enumerate(tag_names)}
+        label_to_id = {tag: i for i, tag in enumerate(tag_names)}
+        print(f"Parsed {len(raw_datasets)} sentences in {parse_seconds:.2f}s "
+              f"({len(raw_datasets) / max(parse_seconds, 1e-9):.0f} sentences/s)")
+
+        # 3. Split into training and evaluation sets
+        split_datasets = raw_datasets.train_test_split(test_size=0.2, seed=42)
+
+        # 4. Tokenize and Align Labels (in parallel for large corpora)
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_CHECKPOINT)
+        num_proc = max(1, min(NUM_PROC, len(raw_datasets) // MIN_SENTENCES_PER_PROC))
+        if num_proc > 1:
+            # Workers already run in parallel; nested Rust tokenizer threads would oversubscribe the CPU
+            os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+        tokenize_start = time.perf_counter()
+        tokenized_datasets = split_datasets.map(
+            tokenize_and_align_labels,
+            fn_kwargs={'tokenizer': tokenizer, 'label_to_id': label_to_id},
+            batched=True,
+            num_proc=num_proc if num_proc > 1 else None,
+        )
+        tokenize_seconds = time.perf_counter() - tokenize_start
+        total_tokens = sum(
+            len(ids) for split in tokenized_datasets.values()
+            for batch in split.iter(batch_size=10000) for ids in batch['input_ids']
+        )
+        print(f"Tokenization and label alignment complete in {tokenize_seconds:.2f}s with {num_proc} process(es) "
+              f"({total_tokens / max(tokenize_seconds, 1e-9):.0f} tokens/s)")
+
+        # 5. Store in the cache for the next run
+        if os.path.exists(cache_path):
+            shutil.rmtree(os.path.join(cache_path, 'tokenized'), ignore_errors=True)
+        tokenized_datasets.save_to_disk(os.path.join(cache_path, 'tokenized'))
+        with open(os.path.join(cache_path, 'labels.json'), 'w') as f:
+            json.dump(id_to_label, f, indent=2)
 
-    # 1. Determine all unique labels
-    tag_names = get_iob_tags_from_conll(CONLL_FILE)
-    id_to_label = {i: tag for i, tag in enumerate(tag_names)}
-    label_to_id = {tag: i for i, tag in enumerate(tag_names)}
     print(f"Found {len(tag_names)} unique IOB tags: {tag_names}")
+    print(f"Data split: Train={len(tokenized_datasets['train'])}, Test={len(tokenized_datasets['test'])}")
 
+    # 6. Save label map and processed datasets
     with open(os.path.join(OUTPUT_DIR, 'labels.json'), 'w') as f:
         json.dump(id_to_label, f, indent=2)
     print(f"Label map saved to {OUTPUT_DIR}/labels.json")
 
-    # 2. Parse CoNLL file manually (skip Hugging Face conll2003)
-    try:
-        tokens_list = []
-        tags_list = []
-
-        current_tokens = []
-        current_tags = []
-
-        with open(CONLL_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('-DOCSTART-'):
-                    if current_tokens:
-                        tokens_list.append(current_tokens)
-                        tags_list.append(current_tags)
-                    current_tokens = []
-                    current_tags = []
-                else:
-                    parts = line.split()
-                    if len(parts) == 2:
-                        current_tokens.append(parts[0])
-                        current_tags.append(parts[1])
-            if current_tokens:
-                tokens_list.append(current_tokens)
-                tags_list.append(current_tags)
-
-        raw_datasets = Dataset.from_dict({'tokens': tokens_list, 'ner_tags': tags_list})
-
-    except Exception as e:
-        print(f"FATAL ERROR: Failed to load and parse the CoNLL file. Check file format: {e}")
-        exit()
-
-    # 3. Split into training and evaluation sets
-    split_datasets = raw_datasets.train_test_split(test_size=0.2, seed=42)
-    print(f"Data split: Train={len(split_datasets['train'])}, Test={len(split_datasets['test'])}")
-
-    # 4. Tokenize and Align Labels
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_CHECKPOINT)
-
-    tokenized_datasets = split_datasets.map(
-        lambda examples: tokenize_and_align_labels(examples, tokenizer, label_to_id),
-        batched=True
-    )
-    print("Tokenization and label alignment complete.")
-
-    # 5. Save processed datasets
     tokenized_datasets['train'].save_to_disk(os.path.join(OUTPUT_DIR, 'train.pt'))
     tokenized_datasets['test'].save_to_disk(os.path.join(OUTPUT_DIR, 'eval.pt'))
     print(f"✅ Processed data saved to {OUTPUT_DIR}/.")
 
+    total_seconds = time.perf_counter() - run_start
+    peak_mb = peak_memory_mb()
+    print(f"Total time: {total_seconds:.2f}s, peak memory: {f'{peak_mb:.0f} MB' if peak_mb else 'n/a'}")
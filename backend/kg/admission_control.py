@@ -0,0 +1,295 @@
+"""
+Admission control for the /ask endpoint.
+
+Bounds the number of requests running the NER -> RAG -> LLM pipeline at once,
+queues the rest per priority class with a bounded queue each, and sheds load
+(fast 503 + Retry-After) instead of letting latency grow without limit.
+Deadlines travel with the request so work whose client has already given up
+is dropped before the expensive LLM call. LLM calls take one of a smaller number of
+LLM slots; a request waits for one as long as the wait still fits its deadline.
+Background work (cache warm-up) has its own, separate LLM budget.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# Highest priority first: interactive UI traffic is always dequeued before batch/eval callers
+PRIORITY_CLASSES = ("interactive", "batch")
+DEFAULT_PRIORITY = "interactive"
+
+# Weight of the newest sample in the latency moving averages
+EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of being served."""
+
+    def __init__(self, reason: str, status_code: int = 503, retry_after: int = 1):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """Absolute deadline of a request, checked between pipeline stages."""
+
+    def __init__(self, budget_s: float):
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s
+
+    @classmethod
+    def from_header(cls, value, default_s: float):
+        """Builds a deadline from an `X-Request-Deadline-Ms` style budget, falling back to the default."""
+        try:
+            budget_s = float(value) / 1000.0
+        except (TypeError, ValueError):
+            budget_s = default_s
+        if budget_s <= 0:
+            budget_s = default_s
+        return cls(budget_s)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with per-priority bounded queues, deadline-aware waiting, and
+    deadline-aware LLM slots used to switch /ask into degraded (retrieval-only) mode.
+
+    All state is touched from the event loop only, so no locking is needed.
+    """
+
+    def __init__(self, max_concurrency: int, queue_limits: dict, llm_max_concurrency: int,
+                 background_llm_concurrency: int = 1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_limits = {p: queue_limits.get(p, 0) for p in PRIORITY_CLASSES}
+        self.llm_max_concurrency = max(1, llm_max_concurrency)
+        self.background_llm_max = max(1, background_llm_concurrency)
+
+        self.active = 0
+        self.waiters = {p: deque() for p in PRIORITY_CLASSES}
+        self.llm_inflight = 0
+        self.llm_waiters = {p: deque() for p in PRIORITY_CLASSES}
+        self.background_llm_inflight = 0
+        self.background_llm_waiters = deque()
+
+        # Moving averages used for Retry-After hints and the degrade decision
+        self.service_time_ewma = None
+        self.llm_latency_ewma = None
+
+        # Counters
+        self.admitted = {p: 0 for p in PRIORITY_CLASSES}
+        self.shed = {p: {"queue_full": 0, "deadline": 0, "llm_saturated": 0} for p in PRIORITY_CLASSES}
+        self.degraded = {p: 0 for p in PRIORITY_CLASSES}
+
+    # --- Classification ---
+
+    def classify(self, value) -> str:
+        """Maps an `X-Request-Priority` header value to a known priority class."""
+        value = (value or "").strip().lower()
+        return value if value in PRIORITY_CLASSES else DEFAULT_PRIORITY
+
+    # --- Admission ---
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a queued slot frees up, used for the Retry-After header."""
+        per_request = self.service_time_ewma or 1.0
+        queued = sum(len(q) for q in self.waiters.values())
+        return max(1, int(round(per_request * (queued + 1) / self.max_concurrency)))
+
+    def reject(self, priority: str, reason: str, message: str, status_code: int = 503):
+        """Counts a shed request and raises the matching AdmissionRejected."""
+        self.shed[priority][reason] += 1
+        raise AdmissionRejected(message, status_code=status_code, retry_after=self.retry_after())
+
+    def check_deadline(self, priority: str, deadline: Deadline, stage: str):
+        """Drops the request if its deadline passed before `stage` starts."""
+        if deadline.expired():
+            self.reject(priority, "deadline", f"Request deadline exceeded before {stage}.", status_code=504)
+
+    @asynccontextmanager
+    async def admit(self, priority: str, deadline: Deadline):
+        """Holds one pipeline slot for the duration of the block, queueing or shedding as needed."""
+        if self.active < self.max_concurrency and not any(self.waiters.values()):
+            self.active += 1
+        else:
+            await self._wait_for_slot(priority, deadline)
+
+        self.admitted[priority] += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.service_time_ewma = self._ewma(self.service_time_ewma, time.monotonic() - start)
+            self._release()
+
+    async def _wait_for_slot(self, priority: str, deadline: Deadline):
+        queue = self.waiters[priority]
+        if len(queue) >= self.queue_limits[priority]:
+            self.reject(priority, "queue_full", f"Server is saturated ({priority} queue full).")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=max(deadline.remaining(), 0))
+        except asyncio.CancelledError:
+            # Client went away while queued; hand back the slot if it was already granted
+            self._abandon(queue, waiter, self._release)
+            raise
+
+        if not waiter.done():
+            self._abandon(queue, waiter, self._release)
+            self.reject(priority, "deadline", "Request deadline exceeded while queued.", status_code=504)
+
+    @staticmethod
+    def _abandon(queue: deque, waiter: asyncio.Future, release):
+        if waiter.done() and not waiter.cancelled():
+            release()
+            return
+        waiter.cancel()
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self):
+        if not self._hand_off(self.waiters):
+            self.active -= 1
+
+    @staticmethod
+    def _hand_off(waiters: dict) -> bool:
+        # Hand the slot directly to the next waiter (highest priority first) so it cannot be stolen
+        for priority in PRIORITY_CLASSES:
+            queue = waiters[priority]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return True
+        return False
+
+    # --- LLM slots / degraded mode ---
+
+    def llm_wait_estimate(self) -> float:
+        """Expected seconds until a new caller gets an LLM slot (0 when one is free)."""
+        queued = sum(len(q) for q in self.llm_waiters.values())
+        if self.llm_inflight < self.llm_max_concurrency and not queued:
+            return 0.0
+        return (self.llm_latency_ewma or 0.0) * (queued + 1) / self.llm_max_concurrency
+
+    @asynccontextmanager
+    async def llm_call(self, priority: str, deadline: Deadline, background: bool = False):
+        """
+        Holds an LLM slot for the block and yields True. Waits for a slot while the expected
+        wait plus one LLM call still fits the deadline; yields False instead (the caller then
+        degrades or sheds) when it would not, so busy slots alone never degrade a request.
+        Background calls use their own budget of slots and never take a live one.
+        """
+        if background:
+            granted, release = await self._acquire_background_llm(deadline), self._release_background_llm
+        else:
+            granted, release = await self._acquire_llm(priority, deadline), self._release_llm
+        if not granted:
+            yield False
+            return
+        start = time.monotonic()
+        try:
+            yield True
+            # Only completed calls are latency samples; failed or abandoned ones say nothing about the LLM
+            self.llm_latency_ewma = self._ewma(self.llm_latency_ewma, time.monotonic() - start)
+        finally:
+            release()
+
+    async def _acquire_llm(self, priority: str, deadline: Deadline) -> bool:
+        call_s = self.llm_latency_ewma or 0.0
+        if deadline.remaining() < self.llm_wait_estimate() + call_s:
+            return False
+        if self.llm_inflight < self.llm_max_concurrency and not any(self.llm_waiters.values()):
+            self.llm_inflight += 1
+            return True
+
+        queue = self.llm_waiters[priority]
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            # Stop waiting once there is no longer time left for the call itself
+            await asyncio.wait({waiter}, timeout=max(deadline.remaining() - call_s, 0))
+        except asyncio.CancelledError:
+            self._abandon(queue, waiter, self._release_llm)
+            raise
+        if not waiter.done():
+            self._abandon(queue, waiter, self._release_llm)
+            return False
+        return True
+
+    def _release_llm(self):
+        if not self._hand_off(self.llm_waiters):
+            self.llm_inflight -= 1
+
+    async def _acquire_background_llm(self, deadline: Deadline) -> bool:
+        if self.background_llm_inflight < self.background_llm_max:
+            self.background_llm_inflight += 1
+            return True
+        waiter = asyncio.get_running_loop().create_future()
+        self.background_llm_waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=max(deadline.remaining() - (self.llm_latency_ewma or 0.0), 0))
+        except asyncio.CancelledError:
+            self._abandon(self.background_llm_waiters, waiter, self._release_background_llm)
+            raise
+        if not waiter.done():
+            self._abandon(self.background_llm_waiters, waiter, self._release_background_llm)
+            return False
+        return True
+
+    def _release_background_llm(self):
+        while self.background_llm_waiters:
+            waiter = self.background_llm_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.background_llm_inflight -= 1
+
+    def has_spare_capacity(self, headroom: int = 1) -> bool:
+        """
+        True when background work (e.g. cache warm-up) can take a pipeline slot while still
+        leaving `headroom` free for live traffic, a background LLM slot is free, and nothing
+        (pipeline or LLM) is queued. Background LLM calls never use the live LLM slots.
+        """
+        if any(self.waiters.values()) or any(self.llm_waiters.values()):
+            return False
+        slots_free = self.active == 0 or self.active + 1 + headroom <= self.max_concurrency
+        return slots_free and self.background_llm_inflight < self.background_llm_max
+
+    def record_degraded(self, priority: str):
+        self.degraded[priority] += 1
+
+    # --- Reporting ---
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": {p: len(q) for p, q in self.waiters.items()},
+            "queue_limits": dict(self.queue_limits),
+            "admitted": dict(self.admitted),
+            "shed": {p: dict(counts) for p, counts in self.shed.items()},
+            "degraded": dict(self.degraded),
+            "llm_inflight": self.llm_inflight,
+            "llm_max_concurrency": self.llm_max_concurrency,
+            "llm_queue_depth": {p: len(q) for p, q in self.llm_waiters.items()},
+            "background_llm_inflight": self.background_llm_inflight,
+            "background_llm_max": self.background_llm_max,
+            "llm_latency_ewma_s": self.llm_latency_ewma,
+            "service_time_ewma_s": self.service_time_ewma,
+        }
+
+    @staticmethod
+    def _ewma(current, sample: float) -> float:
+        return sample if current is None else (1 - EWMA_ALPHA) * current + EWMA_ALPHA * sample
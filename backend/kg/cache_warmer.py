@@ -0,0 +1,205 @@
+"""
+Query log and cache warm-up for the /ask pipeline.
+
+/ask appends one compact JSON line per request to the query log (normalized question,
+filters, latency, route), buffered and written in batches off the response path.
+At startup, and optionally on a schedule, the warm-up job replays the most frequent
+logged questions plus per-domain seed questions through the pipeline so the embedding,
+retrieval and answer caches are hot before users arrive.
+
+Warm-up requests run at "batch" priority, at most `concurrency` at a time, only while the
+admission controller has spare capacity, and with their own LLM budget, so they never
+compete with live traffic.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import Counter
+from admission_control import AdmissionRejected
+from query_cache import normalize_question
+
+# Seed questions per /domains entry, replayed even before any traffic has been logged
+DOMAIN_SEED_QUESTIONS = {
+    "bone": [
+        "What are the effects of microgravity on bone density?",
+        "Which countermeasures reduce spaceflight-induced bone loss?",
+    ],
+    "immune": [
+        "How does spaceflight affect the immune system?",
+        "Does microgravity cause latent virus reactivation in astronauts?",
+    ],
+    "neuro": [
+        "How does spaceflight affect the brain and cognition?",
+        "What is the effect of space radiation on the central nervous system?",
+    ],
+    "plants": [
+        "How does microgravity affect plant root growth?",
+        "Which genes change expression in plants grown in space?",
+    ],
+    "microbiome": [
+        "How does spaceflight change the gut microbiome?",
+        "Do bacteria become more virulent in microgravity?",
+    ],
+    "methods": [
+        "Which ground-based analogs are used to simulate microgravity?",
+        "How is hindlimb unloading used in space biology research?",
+    ],
+}
+
+
+class QueryLog:
+    """Append-only JSON-lines log of /ask requests, rotated once it reaches max_bytes."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def append(self, question: str, filters: dict, latency_ms: float, route: str):
+        self.append_many([(question, filters, latency_ms, route, time.time())])
+
+    def append_many(self, entries):
+        """Appends (question, filters, latency_ms, route, timestamp) entries with one file open."""
+        lines = "".join(
+            json.dumps({
+                "t": round(t, 3),
+                "q": normalize_question(question),
+                "f": filters or {},
+                "ms": round(latency_ms, 1),
+                "r": route,
+            }, separators=(',', ':'), sort_keys=True) + "\n"
+            for question, filters, latency_ms, route, t in entries
+        )
+        with self.lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+    def top_questions(self, n: int) -> list[tuple[str, dict]]:
+        """Most frequent (question, filters) pairs in the current and previous log file."""
+        counts = Counter()
+        for path in (self.path + ".1", self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partially written line
+                    counts[json.dumps([record["q"], record.get("f", {})], sort_keys=True)] += 1
+        return [tuple(json.loads(key)) for key, _ in counts.most_common(n)]
+
+
+class BufferedWriter:
+    """
+    Buffers records on the event loop and hands them to write_batch(records) in batches on a
+    worker thread, so responses never wait for file I/O. Records arriving while max_pending
+    are already waiting are dropped (and counted) rather than growing memory without bound.
+    """
+
+    STOP = object()
+
+    def __init__(self, write_batch, max_pending: int):
+        self.write_batch = write_batch
+        self.max_pending = max_pending
+        self.queue = None
+        self.task = None
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        """Starts the writer task; call from the running event loop."""
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.task = asyncio.create_task(self._run())
+
+    def submit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except (asyncio.QueueFull, AttributeError):
+            self.dropped += 1
+
+    async def stop(self):
+        """Writes everything submitted so far, then ends the writer task."""
+        if self.task:
+            await self.queue.put(self.STOP)
+            await self.task
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            records = [record for record in batch if record is not self.STOP]
+            if records:
+                try:
+                    await asyncio.to_thread(self.write_batch, records)
+                    self.written += len(records)
+                except OSError as e:
+                    print(f"Error writing request log: {e}")
+            if len(records) < len(batch):
+                return
+
+    def stats(self) -> dict:
+        return {"pending": self.queue.qsize() if self.queue else 0, "written": self.written, "dropped": self.dropped}
+
+
+def warmup_questions(query_log: QueryLog, domains: list[str], top_n: int) -> list[tuple[str, dict]]:
+    """Top-N logged questions followed by the seed questions of every domain, without duplicates."""
+    questions = query_log.top_questions(top_n)
+    for domain in domains:
+        questions.extend((q, {}) for q in DOMAIN_SEED_QUESTIONS.get(domain, []))
+    seen = set()
+    unique = []
+    for question, filters in questions:
+        key = json.dumps([normalize_question(question), filters], sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            unique.append((question, filters))
+    return unique
+
+
+async def warm_caches(warm_one, questions, admission, concurrency: int, idle_poll_s: float = 1.0) -> dict:
+    """
+    Replays questions through `warm_one(question, filters)` (which returns True if it did work,
+    False on a cache hit), waiting for idle capacity before each one.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    summary = {"warmed": 0, "already_cached": 0, "skipped": 0, "failed": 0}
+
+    async def run(question, filters):
+        async with semaphore:
+            while not admission.has_spare_capacity():
+                await asyncio.sleep(idle_poll_s)
+            try:
+                summary["warmed" if await warm_one(question, filters) else "already_cached"] += 1
+            except AdmissionRejected:
+                summary["skipped"] += 1
+            except Exception as e:
+                summary["failed"] += 1
+                print(f"Cache warm-up failed for '{question}': {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(q, f) for q, f in questions))
+    summary["seconds"] = round(time.perf_counter() - start, 1)
+    return summary
+
+
+async def warm_from_log(warm_one, query_log, domains, admission, top_n, concurrency) -> dict:
+    """One warm-up pass; the query log is read in a worker thread, not on the event loop."""
+    questions = await asyncio.to_thread(warmup_questions, query_log, domains, top_n)
+    summary = await warm_caches(warm_one, questions, admission, concurrency)
+    print(f"Cache warm-up complete: {summary}")
+    return summary
+
+
+async def run_warmup_schedule(warm_one, query_log, domains, admission, top_n, concurrency, interval_s):
+    """Warms once at startup, then every interval_s seconds (interval_s <= 0: startup only)."""
+    while True:
+        await warm_from_log(warm_one, query_log, domains, admission, top_n, concurrency)
+        if interval_s <= 0:
+            return
+        await asyncio.sleep(interval_s)
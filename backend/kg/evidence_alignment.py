@@ -0,0 +1,142 @@
+"""
+Sentence-level evidence alignment for RAG answers.
+
+Splits the LLM answer and the retrieved chunks into sentences, embeds all of them
+with a single batched encode() call (sentences seen in earlier requests come from a
+small LRU cache), and uses one matrix multiply of the normalized embeddings to find,
+for every answer sentence, the best supporting sentence span across the chunks.
+
+The result gives the frontend exact character offsets to highlight, and lets us check
+the LLM's [ID n] markers against the evidence without a second LLM call.
+"""
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Sentence end, keeping any [ID n] markers the LLM placed after the period with that sentence
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])((?:\s*\[ID\s*\d+\])*)\s+(?=["(A-Z0-9])')
+ABBREVIATION_END = re.compile(r'\b(?:e\.g|i\.e|et al|vs|approx|ca|cf|fig|figs|no|ref|refs|dr)\.$', re.IGNORECASE)
+CITATION_MARKER = re.compile(r'\[ID\s*(\d+)\]')
+MIN_SENTENCE_CHARS = 12
+MAX_CHUNK_SENTENCES = 256  # Bounds the encode batch for unusually long contexts
+MIN_SUPPORT_SIMILARITY = 0.45
+EMBEDDING_CACHE_SIZE = 4096
+ENCODE_BATCH_SIZE = 64
+
+
+def split_sentences(text):
+    """Returns (start, end) character spans of the sentences in text, skipping fragments."""
+    spans = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        if ABBREVIATION_END.search(text, start, match.start()):
+            continue
+        spans.append((start, match.end(1)))
+        start = match.end()
+    spans.append((start, len(text)))
+
+    trimmed = []
+    for s, e in spans:
+        sentence = text[s:e]
+        stripped = sentence.strip()
+        if len(stripped) >= MIN_SENTENCE_CHARS:
+            s += len(sentence) - len(sentence.lstrip())
+            trimmed.append((s, s + len(stripped)))
+    return trimmed
+
+
+class SentenceEmbeddingCache:
+    """
+    Thread-safe LRU cache of normalized sentence embeddings; misses are encoded together in one batch.
+
+    Requests align in concurrent worker threads, hence the lock. It is not held while encoding,
+    so requests do not queue behind each other's encode() calls.
+    """
+
+    def __init__(self, encoder, max_size=EMBEDDING_CACHE_SIZE):
+        self.encoder = encoder
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def embed(self, sentences):
+        with self.lock:
+            vectors = {s: self.entries[s] for s in sentences if s in self.entries}
+        missing = list(dict.fromkeys(s for s in sentences if s not in vectors))
+        if missing:
+            encoded = self.encoder.encode(
+                missing, batch_size=ENCODE_BATCH_SIZE, normalize_embeddings=True, convert_to_numpy=True
+            )
+            vectors.update(zip(missing, encoded))
+        with self.lock:
+            for sentence in sentences:
+                self.entries[sentence] = vectors[sentence]
+                self.entries.move_to_end(sentence)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return np.stack([vectors[s] for s in sentences])
+
+
+def align_evidence(answer, chunk_texts, embedder):
+    """
+    Aligns every answer sentence with its best supporting chunk sentence.
+
+    Returns one dict per supported answer sentence, and one per sentence with [ID n]
+    markers whether it is supported or not:
+        chunk        index into chunk_texts
+        answer_start/answer_end   char offsets of the sentence in answer
+        text_start/text_end       char offsets of the supporting span in the chunk
+        similarity   cosine similarity of the two sentences
+        cited_chunks chunk indices the LLM cited with [ID n] markers in that sentence
+        marker_verified  True if a cited chunk holds a sentence above MIN_SUPPORT_SIMILARITY
+                         (near-duplicate chunks don't matter), False if none does, None if
+                         the sentence had no marker
+    A verified marker points at the best span in the cited chunks; an unverified one at the
+    best supporting span elsewhere, or, with no support at all, the closest cited/any span.
+    """
+    answer_spans = split_sentences(answer)
+    chunk_spans = []  # (chunk index, start, end)
+    for chunk_index, text in enumerate(chunk_texts):
+        chunk_spans.extend((chunk_index, s, e) for s, e in split_sentences(text))
+    chunk_spans = chunk_spans[:MAX_CHUNK_SENTENCES]
+    if not answer_spans or not chunk_spans:
+        return []
+
+    # Markers are stripped before embedding so they don't skew the similarity
+    answer_sentences = [CITATION_MARKER.sub('', answer[s:e]).strip() for s, e in answer_spans]
+    chunk_sentences = [chunk_texts[c][s:e].strip() for c, s, e in chunk_spans]
+
+    embeddings = embedder.embed(answer_sentences + chunk_sentences)
+    similarity = embeddings[:len(answer_sentences)] @ embeddings[len(answer_sentences):].T
+    best = similarity.argmax(axis=1)
+
+    alignments = []
+    for i, (start, end) in enumerate(answer_spans):
+        cited = sorted({int(n) - 1 for n in CITATION_MARKER.findall(answer[start:end])})
+        supported = similarity[i, best[i]] >= MIN_SUPPORT_SIMILARITY
+        cited_columns = [j for j, (c, _, _) in enumerate(chunk_spans) if c in cited]
+        if cited_columns:
+            # Judge the marker by the cited chunks alone, not by the single best sentence overall
+            match = max(cited_columns, key=lambda j: similarity[i, j])
+            marker_verified = bool(similarity[i, match] >= MIN_SUPPORT_SIMILARITY)
+            if not marker_verified and supported:
+                match = best[i]
+        elif supported or cited:
+            # Cited chunks that were not retrieved (or fell past MAX_CHUNK_SENTENCES) cannot verify
+            match, marker_verified = best[i], (False if cited else None)
+        else:
+            continue
+        score = float(similarity[i, match])
+        chunk_index, text_start, text_end = chunk_spans[match]
+        alignments.append({
+            "chunk": chunk_index,
+            "answer_start": start,
+            "answer_end": end,
+            "text_start": text_start,
+            "text_end": text_end,
+            "similarity": round(score, 4),
+            "cited_chunks": cited,
+            "marker_verified": marker_verified,
+        })
+    return alignments
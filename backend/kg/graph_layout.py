@@ -0,0 +1,353 @@
+"""
+Precomputes a 2D layout of the knowledge graph and cuts it into level-of-detail tiles.
+
+Run after knowledge_graph_builder.py. The full node-link graph is far too large to ship
+to the browser, so this step lays it out once on the server (vectorized NumPy
+force-directed layout) and writes, for every zoom level z, a 2^z x 2^z grid of tiles
+holding only the top-weighted nodes and edges of that region. /kg/tiles in
+hybrid_api.py serves those tiles, so the frontend fetches only what is in view.
+
+Output layout (TILES_DIR):
+    manifest.json                      zoom levels, limits, per-zoom tile index, version and tiles_dir
+    <version>/positions.json.gz        every node's normalized (x, y) and weight
+    <version>/{z}/{x}/{y}.json.gz      one gzip-compressed tile
+
+Each build is written to a staging directory, renamed to its version, and only then made
+live by atomically replacing manifest.json, so a reader never sees tiles of two layouts.
+The previous version is kept for readers still holding the old manifest; older ones are deleted.
+"""
+import os
+import json
+import gzip
+import uuid
+import shutil
+import hashlib
+import time
+import numpy as np
+import pyarrow.parquet as pq
+from kg_columnar import NODES_PARQUET, EDGES_PARQUET
+
+# --- Configuration ---
+INPUT_GRAPH_FILE = 'knowledge_graph.json'
+TILES_DIR = 'kg_tiles'
+MAX_ZOOM = 6                  # zoom z covers the unit square with 2^z x 2^z tiles
+MAX_NODES_PER_TILE = 200
+MAX_EDGES_PER_TILE = 400
+LAYOUT_ITERATIONS = 120
+REPULSION_GRID = 32           # cells per axis used to approximate node-node repulsion
+REPULSION_CHUNK = 4096        # nodes per vectorized repulsion block (bounds memory)
+GRAVITY = 2.0                 # pull toward the centre so disconnected components stay in frame
+LAYOUT_SEED = 42
+
+# --- Graph Loading ---
+
+def load_graph_arrays(file_path):
+    """
+    Loads the node-link JSON written by knowledge_graph_builder.py into flat arrays.
+
+    Returns (nodes, src, dst, weight, edge_labels) where nodes is the list of node dicts
+    and the edge arrays index into it.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    nodes = data.get('nodes', [])
+    index = {node['id']: i for i, node in enumerate(nodes)}
+    links = data.get('links', data.get('edges', []))
+
+    src = np.fromiter((index[link['source']] for link in links), dtype=np.int64, count=len(links))
+    dst = np.fromiter((index[link['target']] for link in links), dtype=np.int64, count=len(links))
+    weight = np.fromiter((link.get('weight', 1) for link in links), dtype=np.float64, count=len(links))
+    edge_labels = [link.get('label', '') for link in links]
+    return nodes, src, dst, weight, edge_labels
+
+def load_graph_arrays_parquet(nodes_path=NODES_PARQUET, edges_path=EDGES_PARQUET):
+    """Same as load_graph_arrays, but reads the columnar tables written by kg_columnar.py."""
+    node_table = pq.read_table(nodes_path, columns=['id', 'label', 'type'])
+    nodes = node_table.to_pylist()
+    index = {node['id']: i for i, node in enumerate(nodes)}
+
+    edge_table = pq.read_table(edges_path, columns=['source', 'target', 'weight', 'label'])
+    src = np.array([index[s] for s in edge_table.column('source').to_pylist()], dtype=np.int64)
+    dst = np.array([index[t] for t in edge_table.column('target').to_pylist()], dtype=np.int64)
+    weight = edge_table.column('weight').to_numpy().astype(np.float64)
+    edge_labels = edge_table.column('label').to_pylist()
+    return nodes, src, dst, weight, edge_labels
+
+# --- Layout ---
+
+def force_directed_layout(n, src, dst, weight, iterations=LAYOUT_ITERATIONS,
+                          grid_size=REPULSION_GRID, gravity=GRAVITY, seed=LAYOUT_SEED):
+    """
+    Fruchterman-Reingold layout vectorized with NumPy.
+
+    Attraction is computed exactly over the edge arrays. Repulsion is approximated by
+    binning nodes into a grid_size x grid_size grid and repelling each node from every
+    cell's centre of mass (the node's own cell excludes the node itself), which keeps
+    each iteration O(n * grid_size^2) instead of O(n^2). A linear gravity term keeps
+    isolated nodes and small components from drifting away from the main component.
+    """
+    if n == 0:
+        return np.zeros((0, 2))
+
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2))
+    k = 1.0 / np.sqrt(n)            # ideal edge length in the unit square
+    edge_strength = np.log1p(weight)  # heavy co-occurrence pulls harder, but sub-linearly
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    num_cells = grid_size * grid_size
+
+    for _ in range(iterations):
+        disp = np.zeros_like(pos)
+
+        # Repulsion against grid cell centres of mass
+        lo = pos.min(axis=0)
+        span = np.maximum(pos.max(axis=0) - lo, 1e-9)
+        cell_xy = np.minimum(((pos - lo) / span * grid_size).astype(np.int64), grid_size - 1)
+        cell = cell_xy[:, 0] * grid_size + cell_xy[:, 1]
+        mass = np.bincount(cell, minlength=num_cells).astype(np.float64)
+        sums = np.stack([
+            np.bincount(cell, weights=pos[:, 0], minlength=num_cells),
+            np.bincount(cell, weights=pos[:, 1], minlength=num_cells),
+        ], axis=1)
+        occupied = mass > 0
+        centroids = sums[occupied] / mass[occupied, None]
+        occ_mass = mass[occupied]
+        occ_index = np.cumsum(occupied) - 1  # cell id -> row in centroids
+
+        for start in range(0, n, REPULSION_CHUNK):
+            block = slice(start, min(start + REPULSION_CHUNK, n))
+            delta = pos[block, None, :] - centroids[None, :, :]
+            dist2 = np.maximum((delta ** 2).sum(axis=2), 1e-12)
+            force = (k * k) * occ_mass[None, :] / dist2
+            # Drop the own-cell term; it is replaced below by the cell's mass without this node
+            own = occ_index[cell[block]]
+            force[np.arange(force.shape[0]), own] = 0.0
+            disp[block] += (delta * force[:, :, None]).sum(axis=1)
+
+        own_mass = mass[cell] - 1.0
+        has_peers = own_mass > 0
+        peer_centroid = np.where(
+            has_peers[:, None], (sums[cell] - pos) / np.maximum(own_mass, 1.0)[:, None], pos
+        )
+        delta = pos - peer_centroid
+        dist2 = np.maximum((delta ** 2).sum(axis=1), 1e-12)
+        disp += delta * np.where(has_peers, (k * k) * own_mass / dist2, 0.0)[:, None]
+
+        # Attraction along edges
+        if len(src):
+            delta = pos[src] - pos[dst]
+            dist = np.sqrt((delta ** 2).sum(axis=1))
+            pull = delta * (dist * edge_strength / k)[:, None]
+            for axis in range(2):
+                disp[:, axis] -= np.bincount(src, weights=pull[:, axis], minlength=n)
+                disp[:, axis] += np.bincount(dst, weights=pull[:, axis], minlength=n)
+
+        # Gravity toward the centre of the layout
+        disp -= gravity * (pos - pos.mean(axis=0))
+
+        # Move, capped by the current temperature
+        length = np.maximum(np.sqrt((disp ** 2).sum(axis=1)), 1e-12)
+        pos += disp / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature -= cooling
+
+    return normalize_positions(pos)
+
+def normalize_positions(pos, margin=0.02, clip_percentile=0.5):
+    """
+    Scales positions into [margin, 1 - margin] on both axes, preserving aspect ratio.
+
+    The extent is taken between the clip_percentile and (100 - clip_percentile) percentiles
+    so a handful of outliers cannot squash the rest of the graph into a single tile;
+    outliers are clamped to the border.
+    """
+    lo = np.percentile(pos, clip_percentile, axis=0)
+    hi = np.percentile(pos, 100 - clip_percentile, axis=0)
+    span = max(float((hi - lo).max()), 1e-9)
+    scaled = margin + (pos - lo) / span * (1.0 - 2 * margin)
+    return np.clip(scaled, 0.0, 1.0)
+
+# --- Level-of-Detail Tiling ---
+
+def tile_ids(pos, zoom):
+    """Returns the (x, y) tile index of every position at the given zoom level."""
+    tiles_per_axis = 1 << zoom
+    xy = np.minimum((pos * tiles_per_axis).astype(np.int64), tiles_per_axis - 1)
+    return xy[:, 0], xy[:, 1]
+
+def top_k_per_group(group, score, k):
+    """
+    Boolean mask selecting the k highest-scoring items of every group.
+
+    Vectorized: sort by (group, -score), then rank each item within its group.
+    """
+    if len(group) == 0:
+        return np.zeros(0, dtype=bool)
+    order = np.lexsort((-score, group))
+    sorted_group = group[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_group)) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - group_start
+    return rank < k
+
+def build_tiles(nodes, pos, src, dst, weight, edge_labels, output_dir=TILES_DIR,
+                max_zoom=MAX_ZOOM, max_nodes=MAX_NODES_PER_TILE, max_edges=MAX_EDGES_PER_TILE):
+    """
+    Writes gzip-compressed tiles for zoom levels 0..max_zoom into output_dir/<version>/,
+    then publishes them by replacing output_dir/manifest.json.
+
+    A node appears in a tile when it is among the tile's top `max_nodes` by weighted degree.
+    Because every tile is contained in its parent, a node visible at zoom z stays visible
+    at every deeper zoom. An edge appears in a tile when both endpoints are visible at that
+    zoom and at least one lies in the tile, keeping the heaviest `max_edges`.
+    """
+    n = len(nodes)
+    node_weight = (np.bincount(src, weights=weight, minlength=n)
+                   + np.bincount(dst, weights=weight, minlength=n))
+    node_ids = [node['id'] for node in nodes]
+
+    manifest = {
+        "max_zoom": max_zoom,
+        "max_nodes_per_tile": max_nodes,
+        "max_edges_per_tile": max_edges,
+        "node_count": n,
+        "edge_count": int(len(src)),
+        "zooms": {},
+    }
+    version = hashlib.sha256()
+    staging_dir = os.path.join(output_dir, f".build-{uuid.uuid4().hex[:8]}")
+
+    for zoom in range(max_zoom + 1):
+        tiles_per_axis = 1 << zoom
+        tx, ty = tile_ids(pos, zoom)
+        node_tile = tx * tiles_per_axis + ty
+        visible = top_k_per_group(node_tile, node_weight, max_nodes)
+
+        # Edges whose endpoints are both visible, assigned to each endpoint's tile
+        edge_mask = visible[src] & visible[dst] if len(src) else np.zeros(0, dtype=bool)
+        edge_idx = np.flatnonzero(edge_mask)
+        src_tile = node_tile[src[edge_idx]]
+        dst_tile = node_tile[dst[edge_idx]]
+        cross = src_tile != dst_tile
+        edge_group = np.r_[src_tile, dst_tile[cross]]
+        edge_member = np.r_[edge_idx, edge_idx[cross]]
+        keep = top_k_per_group(edge_group, weight[edge_member], max_edges)
+        edge_group, edge_member = edge_group[keep], edge_member[keep]
+
+        visible_idx = np.flatnonzero(visible)
+        edges_by_tile = {}
+        for tile, e in zip(edge_group.tolist(), edge_member.tolist()):
+            edges_by_tile.setdefault(tile, []).append(e)
+        nodes_by_tile = {}
+        for i in visible_idx.tolist():
+            nodes_by_tile.setdefault(int(node_tile[i]), []).append(i)
+
+        tile_index = []
+        for tile, members in nodes_by_tile.items():
+            x, y = divmod(tile, tiles_per_axis)
+            payload = {
+                "z": zoom, "x": x, "y": y,
+                "nodes": [{
+                    "id": node_ids[i],
+                    "label": nodes[i].get('label', node_ids[i]),
+                    "type": nodes[i].get('type'),
+                    "x": round(float(pos[i, 0]), 5),
+                    "y": round(float(pos[i, 1]), 5),
+                    "weight": float(node_weight[i]),
+                } for i in members],
+                "edges": [{
+                    "source": node_ids[src[e]],
+                    "target": node_ids[dst[e]],
+                    "weight": float(weight[e]),
+                    "label": edge_labels[e],
+                } for e in edges_by_tile.get(tile, [])],
+            }
+            raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            version.update(raw)
+            tile_dir = os.path.join(staging_dir, str(zoom), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            # mtime=0 keeps the compressed bytes (and therefore the ETag) reproducible
+            with open(os.path.join(tile_dir, f"{y}.json.gz"), 'wb') as f:
+                f.write(gzip.compress(raw, mtime=0))
+            tile_index.append([x, y, len(payload["nodes"]), len(payload["edges"])])
+
+        manifest["zooms"][str(zoom)] = {
+            "tiles_per_axis": tiles_per_axis,
+            "visible_nodes": int(visible.sum()),
+            "tiles": sorted(tile_index),
+        }
+
+    positions = {
+        "ids": node_ids,
+        "x": np.round(pos[:, 0], 5).tolist(),
+        "y": np.round(pos[:, 1], 5).tolist(),
+        "weight": node_weight.tolist(),
+    }
+    os.makedirs(staging_dir, exist_ok=True)
+    with open(os.path.join(staging_dir, 'positions.json.gz'), 'wb') as f:
+        f.write(gzip.compress(json.dumps(positions, separators=(',', ':')).encode('utf-8'), mtime=0))
+
+    manifest["version"] = version.hexdigest()[:16]
+    manifest["tiles_dir"] = manifest["version"]
+    publish_tiles(output_dir, staging_dir, manifest)
+    return manifest
+
+def publish_tiles(output_dir, staging_dir, manifest):
+    """Moves a finished build to output_dir/<version>, swaps manifest.json, and drops old versions."""
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    try:
+        with open(manifest_path, 'r') as f:
+            previous = json.load(f).get("tiles_dir")
+    except (FileNotFoundError, json.JSONDecodeError):
+        previous = None
+
+    version_dir = os.path.join(output_dir, manifest["tiles_dir"])
+    if os.path.isdir(version_dir):
+        shutil.rmtree(staging_dir)  # Same content hash: this exact layout is already on disk
+    else:
+        os.rename(staging_dir, version_dir)
+
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)  # The new layout goes live here, in one step
+
+    # Keep the previous version for requests that still hold the old manifest
+    keep = {manifest["tiles_dir"], previous}
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if os.path.isdir(path) and name not in keep and not name.startswith('.build-'):
+            shutil.rmtree(path, ignore_errors=True)
+
+# --- Main Build Step ---
+
+def build_graph_layout(graph_file=INPUT_GRAPH_FILE, output_dir=TILES_DIR):
+    print("--- Knowledge Graph Layout & Tiling Started ---")
+
+    start = time.perf_counter()
+    if os.path.exists(NODES_PARQUET) and os.path.exists(EDGES_PARQUET):
+        nodes, src, dst, weight, edge_labels = load_graph_arrays_parquet()
+    elif os.path.exists(graph_file):
+        nodes, src, dst, weight, edge_labels = load_graph_arrays(graph_file)
+    else:
+        print(f"FATAL ERROR: Knowledge graph not found at '{graph_file}'. Run knowledge_graph_builder.py first.")
+        return None
+    print(f"Loaded graph: Nodes: {len(nodes)}, Edges: {len(src)} ({time.perf_counter() - start:.1f}s)")
+
+    start = time.perf_counter()
+    pos = force_directed_layout(len(nodes), src, dst, weight)
+    print(f"Layout computed in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = build_tiles(nodes, pos, src, dst, weight, edge_labels, output_dir=output_dir)
+    tile_count = sum(len(z["tiles"]) for z in manifest["zooms"].values())
+    print(f"Wrote {tile_count} tiles over {manifest['max_zoom'] + 1} zoom levels in {time.perf_counter() - start:.1f}s")
+    print(f"✅ Layout tiles (version {manifest['version']}) saved to: {os.path.join(output_dir, manifest['tiles_dir'])}/")
+    return manifest
+
+
+if __name__ == '__main__':
+    build_graph_layout()
@@ -1,18 +1,35 @@
 import os
 import json
+import hmac
 import asyncio
 import networkx as nx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import Optional
 from chromadb import PersistentClient
 from sentence_transformers import SentenceTransformer
-from transformers import pipeline
 import re
 import requests
 import time
+import gzip
+import hashlib
+from functools import lru_cache
 from contextlib import asynccontextmanager # 💡 Added for Lifespan Events
 from dotenv import load_dotenv
+from admission_control import AdmissionController, AdmissionRejected, Deadline
+from kg_columnar import NODES_PARQUET, EDGES_PARQUET, read_graph_parquet
+from ner_runtime import load_ner_variant
+from evidence_alignment import SentenceEmbeddingCache, align_evidence
+from query_cache import TTLCache, query_cache_key
+from cache_warmer import QueryLog, BufferedWriter, run_warmup_schedule, warm_from_log
+from traffic_capture import RequestTrace, TrafficCapture, RecordedLLM, current_trace, stage, add_span, annotate
+from profiling import SamplingProfiler, ProfilerBusy, SlowRequestLog
+from index_versions import (
+    IndexVersion, VersionedIndex, read_current_version, write_current_version, version_path, prune_versions,
+    remove_unfinished_versions,
+)
+from kg_jobs import JobRunner, JobConflict
 
 # Load environment variables
 load_dotenv()
@@ -21,19 +38,95 @@ load_dotenv()
 
 # Use relative paths for Linux environment
 MODEL_DIR = '../models/models/ner_v1_15papers'
+NER_MODEL_VARIANT = os.getenv('NER_MODEL_VARIANT', 'auto') # fp32 | int8 | onnx | onnx-int8 | auto (see ner_runtime.py)
 KG_FILE = 'knowledge_graph.json'
+KG_TILES_DIR = 'kg_tiles' # Written by graph_layout.py
+KG_TILE_CACHE_SIZE = 2048
 CHROMA_DB_DIR = 'chroma_db'
 COLLECTION_NAME = 'nasa_papers_collection'
 EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
 GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash-latest')
 API_KEY = os.getenv('GEMINI_API_KEY', '')
 
+# Admission control for /ask (see admission_control.py)
+ASK_MAX_CONCURRENCY = int(os.getenv('ASK_MAX_CONCURRENCY', '4'))
+ASK_QUEUE_LIMITS = {
+    "interactive": int(os.getenv('ASK_QUEUE_LIMIT_INTERACTIVE', '16')),
+    "batch": int(os.getenv('ASK_QUEUE_LIMIT_BATCH', '8')),
+}
+ASK_DEFAULT_DEADLINE_S = {
+    "interactive": float(os.getenv('ASK_DEADLINE_INTERACTIVE_S', '30')),
+    "batch": float(os.getenv('ASK_DEADLINE_BATCH_S', '120')),
+}
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '2'))
+LLM_REQUEST_TIMEOUT_S = float(os.getenv('LLM_REQUEST_TIMEOUT_S', '30')) # Cap per Gemini attempt, within the deadline
+
+# Query log and caches (see query_cache.py / cache_warmer.py)
+QUERY_LOG_FILE = os.getenv('QUERY_LOG_FILE', 'query_log.jsonl')
+QUERY_LOG_MAX_BYTES = int(os.getenv('QUERY_LOG_MAX_BYTES', str(64 * 1024 * 1024)))
+REQUEST_LOG_BUFFER_SIZE = int(os.getenv('REQUEST_LOG_BUFFER_SIZE', '10000')) # Records waiting to be written
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1024'))
+ANSWER_CACHE_TTL_S = float(os.getenv('ANSWER_CACHE_TTL_S', '3600'))
+RETRIEVAL_CACHE_SIZE = int(os.getenv('RETRIEVAL_CACHE_SIZE', '2048'))
+RETRIEVAL_CACHE_TTL_S = float(os.getenv('RETRIEVAL_CACHE_TTL_S', '3600'))
+QUERY_EMBEDDING_CACHE_SIZE = 4096 # Embeddings never go stale, so only LRU-bounded
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', '1') == '1'
+WARMUP_TOP_N = int(os.getenv('WARMUP_TOP_N', '50')) # Most frequent logged questions to replay
+WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', '1'))
+WARMUP_INTERVAL_S = float(os.getenv('WARMUP_INTERVAL_S', '0')) # 0: warm once at startup only
+WARMUP_LLM_CONCURRENCY = int(os.getenv('WARMUP_LLM_CONCURRENCY', '1')) # LLM budget of warm-up, separate from LLM_MAX_CONCURRENCY
+
+# Traffic capture / replay (see traffic_capture.py and traffic_replay.py)
+TRAFFIC_CAPTURE_FILE = os.getenv('TRAFFIC_CAPTURE_FILE', '') # Empty: capture disabled
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv('TRAFFIC_CAPTURE_MAX_BYTES', str(256 * 1024 * 1024)))
+LLM_REPLAY_FILE = os.getenv('LLM_REPLAY_FILE', '') # A capture file: serve its recorded LLM answers instead of Gemini
+LLM_REPLAY_LATENCY_SCALE = float(os.getenv('LLM_REPLAY_LATENCY_SCALE', '1.0')) # 0: answer instantly
+
+# Admin / debug endpoints (disabled unless ADMIN_TOKEN is set; see profiling.py)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '5000'))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv('SLOW_REQUEST_BUFFER_SIZE', '200'))
+PROFILE_MAX_SECONDS = 120
+
+# Versioned KG / vector index builds (see index_versions.py and kg_jobs.py)
+KG_VERSIONS_DIR = 'kg_versions'
+KG_VERSIONS_KEEP = int(os.getenv('KG_VERSIONS_KEEP', '2')) # Finished versions kept on disk for rollback
+INPUT_CHUNKS_FILE = 'pone.0104830_LS_Tasks.json' # Default corpus for jobs
+
+DOMAINS = ["bone", "immune", "neuro", "plants", "microbiome", "methods"]
+
+# Compact route codes for the query log, keyed by ApiResponse.source_type
+ROUTE_CODES = {
+    "Internal Research Papers RAG": "rag",
+    "General Knowledge Model": "general",
+    "General Knowledge Model (RAG Failed)": "rag_failed",
+    "Internal Research Papers RAG (Degraded: Retrieval Only)": "degraded",
+    "LLM API Failure": "llm_error",
+}
+CACHEABLE_ROUTES = {"rag", "general"} # Degraded and failed answers are never cached
+
 # --- Global Components ---
 # app initialization is now at the end of the setup block
 ner_pipeline = None
+ner_variant = None
 kg_graph = None
+kg_tile_manifest = None
+kg_tile_index = set() # (z, x, y) of the non-empty tiles listed in kg_tile_manifest
+kg_tile_manifest_mtime = -1 # mtime of the manifest.json kg_tile_manifest was loaded from (-1: not read yet)
 chroma_collection = None
 embedding_function = None
+sentence_embeddings = None # Cached sentence embeddings for evidence alignment
+admission = AdmissionController(ASK_MAX_CONCURRENCY, ASK_QUEUE_LIMITS, LLM_MAX_CONCURRENCY, WARMUP_LLM_CONCURRENCY)
+query_log = QueryLog(QUERY_LOG_FILE, QUERY_LOG_MAX_BYTES)
+background_tasks = set() # asyncio keeps only weak references to tasks
+answer_cache = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_S)
+retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL_S)
+query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, float('inf'))
+traffic_capture = TrafficCapture(TRAFFIC_CAPTURE_FILE, TRAFFIC_CAPTURE_MAX_BYTES) if TRAFFIC_CAPTURE_FILE else None
+recorded_llm = None # RecordedLLM stub when LLM_REPLAY_FILE is set
+profiler = SamplingProfiler()
+slow_requests = SlowRequestLog(SLOW_REQUEST_THRESHOLD_MS, SLOW_REQUEST_BUFFER_SIZE)
+chroma_embed_func = None # Query embedding function shared by every index version
 
 # --- API Data Models ---
 
@@ -42,12 +135,22 @@ class Query(BaseModel):
     question: str
     filters: dict = {} # e.g., {"entity_type": ["Methodology", "Dataset"]}
 
+class EvidenceSpan(BaseModel):
+    """An answer sentence and the span of a citation's text that best supports it."""
+    answer_start: int # Char offsets into ApiResponse.answer
+    answer_end: int
+    text_start: int # Char offsets into Citation.text
+    text_end: int
+    similarity: float # Cosine similarity of the two sentences
+    marker_verified: Optional[bool] = None # Whether a cited chunk supports the sentence (None: no marker)
+
 class Citation(BaseModel):
     """Output model for a single citation/evidence card."""
     source: str
     filename: str
     chunk_index: int
     text: str
+    spans: list[EvidenceSpan] = []
 
 class ApiResponse(BaseModel):
     """The complete structured API response."""
@@ -59,49 +162,147 @@ class ApiResponse(BaseModel):
 
 # --- Initialization & Setup (Happens once on startup) ---
 
-def load_knowledge_graph():
-    """Loads the NetworkX Knowledge Graph from JSON."""
-    if not os.path.exists(KG_FILE):
-        print(f"KG File not found at {KG_FILE}. Filtering will be disabled.")
+def load_knowledge_graph(base_dir='.'):
+    """Loads the NetworkX Knowledge Graph, preferring the Parquet tables over the JSON fallback."""
+    nodes_path, edges_path = os.path.join(base_dir, NODES_PARQUET), os.path.join(base_dir, EDGES_PARQUET)
+    kg_path = os.path.join(base_dir, KG_FILE)
+    if os.path.exists(nodes_path) and os.path.exists(edges_path):
+        try:
+            return read_graph_parquet(nodes_path, edges_path)
+        except Exception as e:
+            print(f"Error loading KG from Parquet, falling back to JSON: {e}")
+    if not os.path.exists(kg_path):
+        print(f"KG File not found at {kg_path}. Filtering will be disabled.")
         return nx.Graph()
     try:
-        with open(KG_FILE, 'r') as f:
+        with open(kg_path, 'r') as f:
             data = json.load(f)
-        return nx.node_link_data(data)
+        return nx.node_link_graph(data)
     except Exception as e:
         print(f"Error loading KG: {e}")
         return nx.Graph()
 
+def load_tile_manifest():
+    """
+    Returns the manifest of precomputed layout tiles, if graph_layout.py has been run.
+    The manifest is reloaded whenever manifest.json changes, so a re-run layout is picked up
+    without a restart; tiles are cached per manifest version, so layouts are never mixed.
+    """
+    global kg_tile_manifest, kg_tile_index, kg_tile_manifest_mtime
+    manifest_path = os.path.join(KG_TILES_DIR, 'manifest.json')
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if mtime == kg_tile_manifest_mtime:
+        return kg_tile_manifest
+    if mtime is None:
+        print(f"KG tile manifest not found at {manifest_path}. /kg/tiles will be unavailable.")
+        kg_tile_manifest, kg_tile_index, kg_tile_manifest_mtime = None, set(), None
+        return None
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        kg_tile_index = {
+            (int(z), x, y) for z, zoom in manifest["zooms"].items() for x, y, *_ in zoom["tiles"]
+        }
+        kg_tile_manifest, kg_tile_manifest_mtime = manifest, mtime
+        print(f"KG tile manifest loaded (version {kg_tile_manifest.get('version')}).")
+    except Exception as e:
+        # Possibly caught mid-rewrite; the mtime is not recorded, so the next request retries
+        print(f"Error loading KG tile manifest: {e}")
+        kg_tile_manifest = None
+    return kg_tile_manifest
+
 def load_rag_components():
-    """Loads the ChromaDB client and embedding model."""
-    global chroma_collection, embedding_function
+    """Loads the embedding model shared by query embedding and evidence alignment."""
+    global chroma_embed_func, embedding_function, sentence_embeddings
     try:
-        client = PersistentClient(path=CHROMA_DB_DIR)
         embedding_function_st = SentenceTransformer(EMBEDDING_MODEL)
+        embedding_function = embedding_function_st
+        sentence_embeddings = SentenceEmbeddingCache(embedding_function_st)
         
-        # Define a lambda wrapper for ChromaDB's use
-        def chroma_embed_func(texts):
-            return embedding_function_st.encode(texts).tolist()
+        # Define a lambda wrapper for ChromaDB's use; repeated query texts come from the cache
+        def embed_queries(texts):
+            vectors = [query_embedding_cache.get(text) for text in texts]
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            if missing:
+                with stage("retrieval.embed"):
+                    encoded = embedding_function_st.encode([texts[i] for i in missing]).tolist()
+                for i, vector in zip(missing, encoded):
+                    query_embedding_cache.put(texts[i], vector)
+                    vectors[i] = vector
+            return vectors
+
+        chroma_embed_func = embed_queries
+    except Exception as e:
+        print(f"Error loading Sentence Transformer: {e}")
 
-        chroma_collection = client.get_collection(
+def open_chroma_collection(chroma_dir):
+    """Opens the papers collection at chroma_dir; returns (client, collection), (None, None) on failure."""
+    if chroma_embed_func is None:
+        return None, None
+    try:
+        client = PersistentClient(path=chroma_dir)
+        collection = client.get_collection(
             name=COLLECTION_NAME,
             embedding_function=chroma_embed_func # Use the loaded ST model
         )
-        print("ChromaDB collection loaded successfully.")
+        print(f"ChromaDB collection loaded successfully from {chroma_dir}.")
+        return client, collection
     except Exception as e:
-        print(f"Error loading ChromaDB or Sentence Transformer: {e}")
-        chroma_collection = None
+        print(f"Error loading ChromaDB: {e}")
+        return None, None
+
+def load_index_version(version):
+    """Loads the KG and vector index of one version (blocking; run off the event loop)."""
+    path = version_path(KG_VERSIONS_DIR, version)
+    client, collection = open_chroma_collection(os.path.join(path, CHROMA_DB_DIR))
+    return IndexVersion(version, path, load_knowledge_graph(path), client, collection)
+
+def release_index_version(index):
+    """Called once a replaced version has drained: deletes versions beyond KG_VERSIONS_KEEP."""
+    in_use = live_index.loaded_versions() | job_runner.building_versions()
+    asyncio.get_running_loop().run_in_executor(None, prune_versions, KG_VERSIONS_DIR, KG_VERSIONS_KEEP, in_use)
+
+async def activate_index_version(version):
+    """
+    Swaps a finished build in without downtime: the new version is loaded off the event loop
+    while the old one keeps serving, then becomes current in one step. Requests already
+    running keep the version they started with until they finish.
+    """
+    global kg_graph, chroma_collection
+    index = await asyncio.to_thread(load_index_version, version)
+    if index.chroma_collection is None and chroma_collection is not None:
+        index.release()
+        raise RuntimeError(f"Version {version} has no usable vector index.")
+    await asyncio.to_thread(write_current_version, KG_VERSIONS_DIR, version)
+    live_index.swap(index)
+    kg_graph, chroma_collection = index.kg_graph, index.chroma_collection
+    # Cache keys are version-scoped, so old entries can no longer be hit; free them
+    answer_cache.clear()
+    retrieval_cache.clear()
+    print(f"KG version '{version}' is now live.")
+    if WARMUP_ENABLED:
+        task = asyncio.create_task(warm_from_log(
+            warm_cached_answer, query_log, DOMAINS, admission, WARMUP_TOP_N, WARMUP_CONCURRENCY
+        ))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+live_index = VersionedIndex(on_release=release_index_version)
+job_runner = JobRunner(KG_VERSIONS_DIR, activate_index_version)
 
 def load_ner_model():
     """Loads the fine-tuned NER model for routing."""
-    global ner_pipeline
+    global ner_pipeline, ner_variant
     if not os.path.exists(MODEL_DIR):
         print(f"FATAL: NER model not found at {MODEL_DIR}. Routing/Filtering will be impaired.")
         return
     try:
-        # Load pipeline using the fine-tuned model path
-        ner_pipeline = pipeline("ner", model=MODEL_DIR, tokenizer=MODEL_DIR)
-        print(f"NER Pipeline loaded from {MODEL_DIR}.")
+        # Load the configured (possibly quantized/ONNX) variant of the fine-tuned model
+        ner_pipeline, ner_variant = load_ner_variant(MODEL_DIR, NER_MODEL_VARIANT)
+        print(f"NER Pipeline loaded from {MODEL_DIR} (variant: {ner_variant}).")
     except Exception as e:
         print(f"Error loading NER model: {e}")
         ner_pipeline = None
@@ -112,7 +313,8 @@ async def lifespan(app: FastAPI):
     Handles startup and shutdown events for the API.
     Replaces the deprecated @app.on_event("startup") decorator.
     """
-    global kg_graph
+    global kg_graph, chroma_collection, recorded_llm
+    warmup_task = None
     
     # --- Startup Logic (Runs before the application starts accepting requests) ---
     print("Starting API startup process (Loading NER, RAG, and KG)...")
@@ -122,12 +324,34 @@ async def lifespan(app: FastAPI):
         asyncio.to_thread(load_ner_model),
         asyncio.to_thread(load_rag_components)
     )
-    kg_graph = load_knowledge_graph()
+    # No job is running yet, so unfinished version directories are leftovers of a crashed build
+    await asyncio.to_thread(remove_unfinished_versions, KG_VERSIONS_DIR)
+    index = await asyncio.to_thread(load_index_version, read_current_version(KG_VERSIONS_DIR))
+    live_index.swap(index)
+    kg_graph, chroma_collection = index.kg_graph, index.chroma_collection
+    print(f"Serving KG version '{index.version}'.")
+    load_tile_manifest()
+    if LLM_REPLAY_FILE:
+        recorded_llm = RecordedLLM(LLM_REPLAY_FILE, LLM_REPLAY_LATENCY_SCALE)
+        print(f"LLM replay mode: {len(recorded_llm.responses)} recorded answers from {LLM_REPLAY_FILE}.")
+    if traffic_capture:
+        print(f"Capturing /ask traffic to {TRAFFIC_CAPTURE_FILE}.")
+    request_log_writer.start()
+    if WARMUP_ENABLED:
+        # Runs in the background at batch priority; the API starts serving immediately
+        warmup_task = asyncio.create_task(run_warmup_schedule(
+            warm_cached_answer, query_log, DOMAINS, admission,
+            WARMUP_TOP_N, WARMUP_CONCURRENCY, WARMUP_INTERVAL_S,
+        ))
     print("API startup complete.")
     
     yield # API is ready to receive requests
     
     # --- Shutdown Logic (Runs after the application exits) ---
+    if warmup_task:
+        warmup_task.cancel()
+    job_runner.shutdown()
+    await request_log_writer.stop() # Flush buffered query log / capture records
     print("API shutdown completed.")
 
 # Initialize the FastAPI app, passing the new lifespan function
@@ -150,28 +374,39 @@ app.add_middleware(
 
 # --- Core Logic ---
 
-def gemini_api_call_with_retry(payload):
+def gemini_api_call_with_retry(payload, deadline: Deadline = None):
     """
     Handles POST request to Gemini API with exponential backoff.
+    With a deadline, each attempt times out at the remaining budget (capped at
+    LLM_REQUEST_TIMEOUT_S) and no retry is started that the deadline cannot cover.
     """
     api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={API_KEY}"
     max_retries = 5
     delay = 1
 
     for attempt in range(max_retries):
+        timeout = LLM_REQUEST_TIMEOUT_S if deadline is None else min(deadline.remaining(), LLM_REQUEST_TIMEOUT_S)
+        if timeout <= 0:
+            raise HTTPException(status_code=504, detail="Request deadline exceeded during Gemini API retries.")
         try:
-            response = requests.post(
-                api_url, 
-                headers={'Content-Type': 'application/json'}, 
-                data=json.dumps(payload)
-            )
+            with stage("llm.request"):
+                response = requests.post(
+                    api_url, 
+                    headers={'Content-Type': 'application/json'}, 
+                    data=json.dumps(payload),
+                    timeout=timeout
+                )
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
             return response.json()
 
         except requests.exceptions.RequestException as e:
+            if deadline is not None and deadline.remaining() < delay:
+                # Backing off would outlive the request; give up now instead of holding the slots
+                raise HTTPException(status_code=504, detail=f"Gemini API request failed within the request deadline: {e}")
             if attempt < max_retries - 1:
                 # Retry on connection error or rate limit (status code check simplified by raise_for_status)
-                time.sleep(delay)
+                with stage("llm.backoff"):
+                    time.sleep(delay)
                 delay *= 2  # Exponential backoff
             else:
                 # If all retries fail, raise an HTTPException
@@ -184,7 +419,8 @@ def get_ner_entities(text: str) -> list[str]:
     if not ner_pipeline:
         return []
     
-    results = ner_pipeline(text)
+    with stage("ner.pipeline"):
+        results = ner_pipeline(text)
     entities = set()
     for entity in results:
         # Extract the full entity name (e.g., 'Transformer model')
@@ -195,18 +431,145 @@ def get_ner_entities(text: str) -> list[str]:
             entities.add(clean_name)
     return list(entities)
 
+def attach_evidence_spans(answer: str, citations: list[Citation]):
+    """Sentence-level alignment of the answer against the retrieved chunks (see evidence_alignment.py)."""
+    if not sentence_embeddings or not citations:
+        return
+    for alignment in align_evidence(answer, [c.text for c in citations], sentence_embeddings):
+        citations[alignment["chunk"]].spans.append(EvidenceSpan(
+            answer_start=alignment["answer_start"],
+            answer_end=alignment["answer_end"],
+            text_start=alignment["text_start"],
+            text_end=alignment["text_end"],
+            similarity=alignment["similarity"],
+            marker_verified=alignment["marker_verified"],
+        ))
+
+def build_retrieval_only_answer(citations: list[Citation]) -> str:
+    """Degraded-mode answer: the retrieved evidence itself, without LLM synthesis."""
+    lines = [
+        "The answer generator is currently overloaded, so here are the most relevant "
+        "research excerpts retrieved for your question:"
+    ]
+    for citation in citations:
+        excerpt = citation.text if len(citation.text) <= 400 else citation.text[:400].rstrip() + "..."
+        lines.append(f"- [{citation.source}] ({citation.filename}) {excerpt}")
+    return "\n".join(lines)
+
 # --- The Main Endpoint ---
 
 @app.post("/ask", response_model=ApiResponse)
-async def ask_question(query: Query):
+async def ask_question(query: Query, request: Request):
+    """
+    Admission-controlled entry point for /ask.
+
+    Priority comes from the `X-Request-Priority` header ("interactive" or "batch") and the
+    time budget from `X-Request-Deadline-Ms`. Saturated queues return 503 + Retry-After,
+    expired deadlines return 504. Cached answers are returned without taking a slot.
+    Every request is appended to the query log that drives cache warm-up (and, in capture
+    mode, to the traffic capture with its per-stage timings).
+    """
+    arrival = time.time()
+    trace = RequestTrace()
+    current_trace.set(trace)
+    route, status_code = "error", 500
+    try:
+        response = answer_cache.get(versioned_cache_key(live_index.current, query.question, query.filters))
+        if response is None:
+            priority = admission.classify(request.headers.get("X-Request-Priority"))
+            deadline = Deadline.from_header(
+                request.headers.get("X-Request-Deadline-Ms"), ASK_DEFAULT_DEADLINE_S[priority]
+            )
+            queued_at = time.perf_counter()
+            try:
+                async with admission.admit(priority, deadline):
+                    add_span("queue", queued_at)
+                    with live_index.acquire() as index:
+                        response = await answer_question(query, priority, deadline, index)
+            except AdmissionRejected as e:
+                route, status_code = "shed", e.status_code
+                raise HTTPException(
+                    status_code=e.status_code,
+                    detail=e.reason,
+                    headers={"Retry-After": str(e.retry_after)},
+                )
+            route = cache_answer(versioned_cache_key(index, query.question, query.filters), response)
+        else:
+            route = "cache"
+        status_code = 200
+        return response
+    finally:
+        record_request(query, request, arrival, trace, route, status_code)
+
+def versioned_cache_key(index: IndexVersion, question: str, filters: dict) -> str:
+    """Answer/retrieval cache key, scoped to the index version the result came from."""
+    return f"{index.version}|{query_cache_key(question, filters)}"
+
+def cache_answer(cache_key: str, response: ApiResponse) -> str:
+    """Caches successful answers and returns the route code of the response."""
+    route = ROUTE_CODES.get(response.source_type, "other")
+    if route in CACHEABLE_ROUTES:
+        answer_cache.put(cache_key, response)
+    return route
+
+def record_request(query: Query, request: Request, arrival: float, trace: RequestTrace, route: str, status_code: int):
+    """
+    Queues the request for the query log and, in capture mode, the traffic capture.
+    The files are written in batches by request_log_writer, off the response path.
+    """
+    trace.finish()
+    slow_requests.maybe_record(arrival, query.question, route, status_code, trace)
+    capture = None
+    if traffic_capture:
+        capture = (
+            arrival, query.model_dump(),
+            request.headers.get("X-Request-Priority"), request.headers.get("X-Request-Deadline-Ms"),
+            status_code, route, trace,
+        )
+    request_log_writer.submit((query.question, query.filters, trace.elapsed_ms(), route, arrival, capture))
+
+def write_request_records(records):
+    """request_log_writer's batch writer (runs in a worker thread)."""
+    query_log.append_many([record[:5] for record in records])
+    if traffic_capture:
+        for record in records:
+            traffic_capture.record(*record[5])
+
+request_log_writer = BufferedWriter(write_request_records, REQUEST_LOG_BUFFER_SIZE)
+
+async def warm_cached_answer(question: str, filters: dict) -> bool:
+    """
+    Cache warm-up hook: runs one question through the full pipeline at batch priority,
+    filling the embedding, retrieval and answer caches. Not written to the query log.
+    """
+    if versioned_cache_key(live_index.current, question, filters) in answer_cache:
+        return False
+    deadline = Deadline(ASK_DEFAULT_DEADLINE_S["batch"])
+    async with admission.admit("batch", deadline):
+        with live_index.acquire() as index:
+            response = await answer_question(
+                Query(question=question, filters=filters), "batch", deadline, index, background=True
+            )
+    cache_answer(versioned_cache_key(index, question, filters), response)
+    return True
+
+async def answer_question(
+    query: Query, priority: str, deadline: Deadline, index: IndexVersion, background: bool = False
+) -> ApiResponse:
     """
     Handles a user query, routing it through RAG if domain-specific, 
-    or using the general LLM model if not.
+    or using the general LLM model if not. `index` is the KG/vector index version
+    pinned for this request, so a concurrent hot-swap cannot change it mid-request.
+    `background` requests (cache warm-up) use the separate background LLM budget.
+
+    Blocking stages (NER, ChromaDB, Gemini) run in worker threads so the event loop
+    keeps accepting, queueing and shedding requests while they execute.
     """
     question = query.question
     
     # 1. QUESTION CLASSIFICATION / ROUTING
-    domain_entities = get_ner_entities(question)
+    with stage("ner"):
+        domain_entities = await asyncio.to_thread(get_ner_entities, question)
     is_domain_query = bool(domain_entities) or bool(query.filters)
     
     # Initialize response components
@@ -216,17 +579,24 @@ async def ask_question(query: Query):
     citations_data = []
     
     # 2. RAG RETRIEVAL PATH (If domain-specific or filtered)
-    if is_domain_query and chroma_collection:
+    if is_domain_query and index.chroma_collection:
         source_type = "Internal Research Papers RAG"
+        admission.check_deadline(priority, deadline, "retrieval")
         
         # FUTURE IMPLEMENTATION: Apply KG filtering here using query.filters 
         
-        # Retrieve context from ChromaDB
-        results = chroma_collection.query(
-            query_texts=[question],
-            n_results=5, # Retrieve top 5 chunks
-            include=['documents', 'metadatas']
-        )
+        # Retrieve context from ChromaDB (or the retrieval cache)
+        retrieval_key = versioned_cache_key(index, question, query.filters)
+        results = retrieval_cache.get(retrieval_key)
+        if results is None:
+            with stage("retrieval"):
+                results = await asyncio.to_thread(
+                    index.chroma_collection.query,
+                    query_texts=[question],
+                    n_results=5, # Retrieve top 5 chunks
+                    include=['documents', 'metadatas']
+                )
+            retrieval_cache.put(retrieval_key, results)
         
         # 3. CONTEXT CONSTRUCTION
         context_list = []
@@ -283,28 +653,60 @@ async def ask_question(query: Query):
         "tools": tools_setting
     }
 
-    # 5. Call Gemini API
+    # 5. Call Gemini API (or degrade to retrieval-only when waiting for the LLM would overrun the deadline)
+    admission.check_deadline(priority, deadline, "LLM generation")
+    llm_queued_at = time.perf_counter()
     try:
-        llm_response = gemini_api_call_with_retry(payload)
-        answer_text = llm_response.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', 'Error: No response from LLM.')
+        async with admission.llm_call(priority, deadline, background) as llm_granted:
+            add_span("llm.queue", llm_queued_at)
+            if llm_granted:
+                with stage("llm"):
+                    if recorded_llm:
+                        # Replay mode: deterministic, offline answers from a traffic capture
+                        llm_response = await recorded_llm.generate(question, query.filters)
+                    else:
+                        llm_response = await asyncio.to_thread(gemini_api_call_with_retry, payload, deadline)
     except HTTPException as e:
         answer_text = f"API Error: {e.detail}"
         confidence_warning = True
         source_type = "LLM API Failure"
+    else:
+        if not llm_granted:
+            if not citations_data:
+                # Nothing retrieved to fall back on, so shed instead of overrunning the deadline
+                admission.reject(priority, "llm_saturated", "Answer generator is saturated; please retry shortly.")
+            admission.record_degraded(priority)
+            answer_text = build_retrieval_only_answer(citations_data)
+            confidence_warning = True
+            source_type = "Internal Research Papers RAG (Degraded: Retrieval Only)"
+        else:
+            answer_text = llm_response.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', 'Error: No response from LLM.')
+            annotate("llm", answer_text)
+            if is_domain_query:
+                # Precise highlights for the evidence panel, without a second LLM call
+                try:
+                    with stage("alignment"):
+                        await asyncio.to_thread(attach_evidence_spans, answer_text, citations_data)
+                except Exception as e:
+                    # The answer is already there; serve it with citations but without spans
+                    print(f"Error aligning evidence spans: {e}")
+                    for citation in citations_data:
+                        citation.spans.clear()
     
     # 6. Post-Process and Finalize Response
     
     # Extract KG data for the frontend dashboard/filtering sidebar
     kg_output = {}
-    if kg_graph:
+    graph = index.kg_graph
+    if graph:
         for entity_name in domain_entities:
             # Look up related nodes in the graph for visualization/suggestions
-            if kg_graph.has_node(entity_name):
+            if graph.has_node(entity_name):
                 # Simple lookup: returns the node attributes and immediate neighbors
                 kg_output[entity_name] = {
-                    "type": kg_graph.nodes[entity_name].get('type'),
-                    "papers": kg_graph.nodes[entity_name].get('papers', []),
-                    "neighbors_count": len(list(kg_graph.neighbors(entity_name)))
+                    "type": graph.nodes[entity_name].get('type'),
+                    "papers": graph.nodes[entity_name].get('papers', []),
+                    "neighbors_count": len(list(graph.neighbors(entity_name)))
                 }
 
     return ApiResponse(
@@ -323,15 +725,183 @@ async def health_check():
         "timestamp": time.time(),
         "components": {
             "ner_model": ner_pipeline is not None,
+            "ner_variant": ner_variant,
             "rag_system": chroma_collection is not None,
             "knowledge_graph": kg_graph is not None,
+            "kg_tiles": kg_tile_manifest is not None,
             "gemini_api_key": bool(API_KEY),
-        }
+            "traffic_capture": traffic_capture is not None,
+            "llm_replay": recorded_llm is not None,
+            "kg_version": live_index.current.version if live_index.current else None,
+        },
+        "admission": admission.stats(),
+        "caches": {
+            "answers": answer_cache.stats(),
+            "retrieval": retrieval_cache.stats(),
+            "query_embeddings": query_embedding_cache.stats(),
+            "request_log": request_log_writer.stats(),
+        },
     }
 
+@app.get("/admission")
+async def admission_stats():
+    """Queue depth, shed counts and LLM saturation of the /ask admission controller"""
+    return admission.stats()
+
+# --- Knowledge Graph Tiles ---
+
+@lru_cache(maxsize=KG_TILE_CACHE_SIZE)
+def read_kg_tile(layout_version: str, tiles_dir: str, z: int, x: int, y: int):
+    """
+    Returns (gzip bytes, content hash) of a precomputed tile, or None if it is missing.
+    Tiles are read from the manifest's version directory (graph_layout.py never rewrites
+    one in place) and cached per version, so two layouts are never mixed.
+    """
+    tile_path = os.path.join(KG_TILES_DIR, tiles_dir, str(z), str(x), f"{y}.json.gz")
+    if not os.path.exists(tile_path):
+        return None
+    with open(tile_path, 'rb') as f:
+        body = f.read()
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """If-None-Match check: a list of (possibly weak, W/-prefixed) ETags, or '*'."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+@app.get("/kg/tiles")
+async def get_kg_tile_manifest():
+    """Zoom levels, tile limits and the index of non-empty tiles of the precomputed KG layout"""
+    manifest = load_tile_manifest()
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="KG layout tiles have not been built. Run graph_layout.py.")
+    return manifest
+
+@app.get("/kg/tiles/{z}/{x}/{y}")
+async def get_kg_tile(z: int, x: int, y: int, request: Request):
+    """
+    Serves one level-of-detail tile: the top-weighted nodes and edges in region (x, y) at zoom z.
+    Tiles are stored gzip-compressed and sent as-is to clients that accept gzip, with an ETag
+    (one per encoding) so unchanged tiles revalidate with a 304.
+    """
+    manifest = load_tile_manifest()
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="KG layout tiles have not been built. Run graph_layout.py.")
+    tiles_per_axis = 1 << z if 0 <= z <= manifest["max_zoom"] else 0
+    if not (0 <= x < tiles_per_axis and 0 <= y < tiles_per_axis):
+        raise HTTPException(status_code=404, detail=f"Tile {z}/{x}/{y} is outside the tile pyramid.")
+
+    # Only tiles listed in the manifest exist in this layout; anything else is an empty region
+    tile = None
+    if (z, x, y) in kg_tile_index:
+        # Manifests from before versioned tile directories point at the flat kg_tiles/ tree
+        tile = await asyncio.to_thread(read_kg_tile, manifest.get("version"), manifest.get("tiles_dir", ""), z, x, y)
+    if tile is None:
+        # Empty region: nothing was laid out here
+        return {"z": z, "x": x, "y": y, "nodes": [], "edges": []}
+
+    body, content_hash = tile
+    send_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    # The gzip and identity representations differ byte-wise, so each gets its own strong ETag
+    etag = f'"{content_hash}-gzip"' if send_gzip else f'"{content_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+    if send_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=body, media_type="application/json", headers=headers)
+    return Response(content=gzip.decompress(body), media_type="application/json", headers=headers)
+
 @app.get("/domains")
 async def get_available_domains():
     """Get list of available research domains"""
     return {
-        "domains": ["bone", "immune", "neuro", "plants", "microbiome", "methods"]
+        "domains": DOMAINS
+    }
+
+# --- Admin & Debug ---
+
+def require_admin(request: Request):
+    """Admin/debug endpoints need `Authorization: Bearer <ADMIN_TOKEN>` and are disabled without one."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set).")
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token.", headers={"WWW-Authenticate": "Bearer"})
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def run_profiler(seconds: float = 10, interval_ms: float = 10):
+    """
+    Samples every thread's stack for `seconds` and returns the collapsed-stack profile
+    (feed it to flamegraph.pl, speedscope or inferno). Serving continues while it runs.
+    """
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS}].")
+    interval_s = min(max(interval_ms, 1.0), 1000.0) / 1000
+    try:
+        collapsed, summary = await asyncio.wrap_future(profiler.start(seconds, interval_s))
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {
+        "Content-Disposition": f'attachment; filename="profile-{int(time.time())}.collapsed"',
+        "X-Profile-Samples": str(summary["samples"]),
+        "X-Profile-Sampler-CPU-Share": str(summary["sampler_cpu_share"]),
+    }
+    return Response(content=collapsed, media_type="text/plain", headers=headers)
+
+@app.get("/debug/slow", dependencies=[Depends(require_admin)])
+async def get_slow_requests(limit: int = 50, min_ms: float = 0, route: Optional[str] = None):
+    """Per-stage traces of recent /ask requests slower than SLOW_REQUEST_THRESHOLD_MS, newest first"""
+    return {
+        "threshold_ms": slow_requests.threshold_ms,
+        "capacity": slow_requests.entries.maxlen,
+        "recorded": slow_requests.recorded,
+        "requests": slow_requests.query(limit, min_ms, route),
+    }
+
+# --- Admin: KG / Index Rebuild Jobs ---
+
+class JobRequest(BaseModel):
+    """Body of POST /admin/jobs."""
+    kind: str # kg_build | ingest | refresh (see kg_jobs.py)
+    chunks_file: str = INPUT_CHUNKS_FILE # Chunk JSON ([{'text', 'metadata'}, ...]) relative to backend/kg
+    mode: str = "replace" # ingest only: "replace" builds a fresh index, "append" upserts into a copy
+
+@app.post("/admin/jobs", status_code=202, dependencies=[Depends(require_admin)])
+async def start_job(job_request: JobRequest):
+    """Starts a KG build / corpus ingest in a background process; the result is hot-swapped in when it finishes"""
+    params = {
+        "chunks_file": job_request.chunks_file,
+        "mode": job_request.mode,
+        "collection_name": COLLECTION_NAME,
+        "embedding_model": EMBEDDING_MODEL,
     }
+    try:
+        job = job_runner.start(job_request.kind, params, live_index.current.version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.to_dict()
+
+@app.get("/admin/jobs", dependencies=[Depends(require_admin)])
+async def list_jobs():
+    """Recent jobs (newest first) and the live/draining index versions"""
+    jobs = sorted(job_runner.jobs.values(), key=lambda job: job.created, reverse=True)
+    return {"index": live_index.stats(), "jobs": [job.to_dict() for job in jobs]}
+
+@app.get("/admin/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def get_job(job_id: str):
+    """Status and progress of one job"""
+    if job_id not in job_runner.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+    return job_runner.jobs[job_id].to_dict()
+
+@app.delete("/admin/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def cancel_job(job_id: str):
+    """Cancels a running job; its partial version directory is removed and nothing is swapped in"""
+    if job_id not in job_runner.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+    return job_runner.cancel(job_id).to_dict()
@@ -0,0 +1,189 @@
+"""
+Versioned, reference-counted KG + vector index for zero-downtime refreshes.
+
+Each build writes a complete version directory:
+
+    kg_versions/<version>/
+        knowledge_graph_nodes.parquet, knowledge_graph_edges.parquet, knowledge_graph.json
+        chunks.parquet
+        chroma_db/
+        version.json        written last; a directory without it is an unfinished build
+
+and kg_versions/CURRENT names the version the API serves (replaced atomically). Without
+CURRENT the API serves the legacy files in the working directory.
+
+Requests acquire the current IndexVersion for their whole lifetime. swap() makes a new
+version current in a single assignment; the old one is released (Chroma client closed,
+graph dropped) as soon as its last in-flight request finishes.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+from contextlib import contextmanager
+
+CURRENT_FILE = 'CURRENT'
+VERSION_MANIFEST = 'version.json'
+LEGACY_VERSION = 'legacy' # Files in the working directory, from before versioned builds
+
+
+def new_version_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def version_path(versions_dir: str, version: str) -> str:
+    return '.' if version == LEGACY_VERSION else os.path.join(versions_dir, version)
+
+
+def read_current_version(versions_dir: str) -> str:
+    """The version named by CURRENT, or LEGACY_VERSION if there is none (or it is unfinished)."""
+    try:
+        with open(os.path.join(versions_dir, CURRENT_FILE), 'r') as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return LEGACY_VERSION
+    if not os.path.exists(os.path.join(versions_dir, version, VERSION_MANIFEST)):
+        print(f"KG version '{version}' is incomplete; serving the legacy files instead.")
+        return LEGACY_VERSION
+    return version
+
+
+def write_current_version(versions_dir: str, version: str):
+    """Atomically points CURRENT at version, so a crash never leaves a half-written pointer."""
+    os.makedirs(versions_dir, exist_ok=True)
+    tmp_path = os.path.join(versions_dir, f".{CURRENT_FILE}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(versions_dir, CURRENT_FILE))
+
+
+def write_version_manifest(path: str, manifest: dict):
+    with open(os.path.join(path, VERSION_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def prune_versions(versions_dir: str, keep: int, in_use: set) -> list[str]:
+    """
+    Deletes all but the newest `keep` finished versions, never touching versions that are
+    loaded (in_use). Unfinished directories (no manifest yet) are never deleted here: they
+    may belong to a job started after in_use was taken; the job runner removes the
+    directories of failed and cancelled jobs itself.
+    """
+    if not os.path.isdir(versions_dir):
+        return []
+    finished = sorted(
+        (name for name in os.listdir(versions_dir)
+         if os.path.exists(os.path.join(versions_dir, name, VERSION_MANIFEST))),
+        reverse=True,
+    )
+    keep_set = set(finished[:keep]) | in_use
+    removed = []
+    for version in finished:
+        if version not in keep_set:
+            shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
+            removed.append(version)
+    return removed
+
+
+def remove_unfinished_versions(versions_dir: str) -> list[str]:
+    """Deletes build directories left by a previous process; only safe before any job starts."""
+    if not os.path.isdir(versions_dir):
+        return []
+    unfinished = [
+        name for name in os.listdir(versions_dir)
+        if os.path.isdir(os.path.join(versions_dir, name))
+        and not os.path.exists(os.path.join(versions_dir, name, VERSION_MANIFEST))
+    ]
+    for version in unfinished:
+        shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
+    return unfinished
+
+
+def close_chroma_client(client):
+    """
+    ChromaDB 0.4 has no public close(): stop the client's shared system and drop it from the
+    process-wide cache, so its SQLite connection and HNSW segments are actually freed.
+    """
+    try:
+        client._system.stop()
+        type(client)._identifer_to_system.pop(client._identifier, None)
+    except (AttributeError, KeyError) as e:
+        print(f"Could not close ChromaDB client cleanly: {e}")
+
+
+class IndexVersion:
+    """One loaded version of the knowledge graph and vector index."""
+
+    def __init__(self, version: str, path: str, kg_graph, chroma_client, chroma_collection):
+        self.version = version
+        self.path = path
+        self.kg_graph = kg_graph
+        self.chroma_client = chroma_client
+        self.chroma_collection = chroma_collection
+        self.loaded_at = time.time()
+        self.refs = 0
+        self.retired = False
+
+    def release(self):
+        if self.chroma_client is not None:
+            close_chroma_client(self.chroma_client)
+        self.kg_graph = self.chroma_client = self.chroma_collection = None
+
+
+class VersionedIndex:
+    """
+    Holds the current IndexVersion and the retired ones still serving in-flight requests.
+    Touched from the event loop only, like the admission controller, so no locking is needed.
+    """
+
+    def __init__(self, on_release=None):
+        self.current = None
+        self.draining = []
+        self.on_release = on_release # Called with each retired version once it is released
+        self.swaps = 0
+
+    @contextmanager
+    def acquire(self):
+        """Pins the current version for the duration of a request."""
+        index = self.current
+        index.refs += 1
+        try:
+            yield index
+        finally:
+            index.refs -= 1
+            if index.retired and index.refs == 0:
+                self._release(index)
+
+    def swap(self, new_index: IndexVersion):
+        """Makes new_index current; the previous version is released once drained."""
+        old_index, self.current = self.current, new_index
+        self.swaps += 1
+        if old_index is None:
+            return
+        old_index.retired = True
+        if old_index.refs == 0:
+            self._release(old_index)
+        else:
+            self.draining.append(old_index)
+
+    def _release(self, index: IndexVersion):
+        if index in self.draining:
+            self.draining.remove(index)
+        index.release()
+        print(f"KG version '{index.version}' drained and released.")
+        if self.on_release:
+            self.on_release(index)
+
+    def loaded_versions(self) -> set:
+        return {index.version for index in [self.current, *self.draining] if index is not None}
+
+    def stats(self) -> dict:
+        current = self.current
+        return {
+            "current": current.version if current else None,
+            "current_loaded_at": current.loaded_at if current else None,
+            "in_flight": current.refs if current else 0,
+            "draining": [{"version": index.version, "in_flight": index.refs} for index in self.draining],
+            "swaps": self.swaps,
+        }
@@ -0,0 +1,237 @@
+"""
+Columnar (Arrow/Parquet) export and load path for the knowledge graph and chunk corpus.
+
+knowledge_graph.json (indented node-link JSON) and knowledge_graph.gml are slow to write,
+large on disk and slow to parse. This module writes the same data as Parquet tables:
+
+    knowledge_graph_nodes.parquet   id, label, type (dictionary), papers (list<string>)
+    knowledge_graph_edges.parquet   source, target, label (dictionary), weight, source_doc (dictionary)
+    chunks.parquet                  text plus one column per metadata key (union over all chunks)
+
+and reads them back into the NetworkX graph used by hybrid_api.py.
+
+Run directly to convert an existing knowledge_graph.json / chunk file and benchmark
+write time, file size and load time against the JSON and GML outputs.
+"""
+import os
+import json
+import time
+import networkx as nx
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- Configuration ---
+NODES_PARQUET = 'knowledge_graph_nodes.parquet'
+EDGES_PARQUET = 'knowledge_graph_edges.parquet'
+CHUNKS_PARQUET = 'chunks.parquet'
+PARQUET_COMPRESSION = 'zstd'
+
+# Low-cardinality string columns stored as Arrow dictionaries
+NODE_DICTIONARY_COLUMNS = ('type',)
+EDGE_DICTIONARY_COLUMNS = ('label', 'source_doc')
+CHUNK_DICTIONARY_COLUMNS = ('document_filename',)
+# Field metadata marking a chunk column whose values are JSON-encoded (mixed value types)
+JSON_FIELD_METADATA = {b'encoding': b'json'}
+
+# --- Writers ---
+
+def _dictionary_encode(table, columns):
+    """Dictionary-encodes the given string columns of a table in place of the plain ones."""
+    for name in columns:
+        index = table.schema.get_field_index(name)
+        field = table.schema.field(index) if index >= 0 else None
+        if field is not None and pa.types.is_string(field.type):
+            encoded = table.column(name).dictionary_encode()
+            table = table.set_column(index, pa.field(name, encoded.type, metadata=field.metadata), encoded)
+    return table
+
+def graph_to_tables(G):
+    """Converts the builder's NetworkX graph into (nodes, edges) Arrow tables."""
+    node_ids = list(G.nodes)
+    node_data = [G.nodes[n] for n in node_ids]
+    nodes = pa.table({
+        'id': pa.array(node_ids, type=pa.string()),
+        'label': pa.array([d.get('label', n) for n, d in zip(node_ids, node_data)], type=pa.string()),
+        'type': pa.array([d.get('type') for d in node_data], type=pa.string()),
+        'papers': pa.array([d.get('papers', []) for d in node_data], type=pa.list_(pa.string())),
+    })
+
+    sources, targets, labels, weights, source_docs = [], [], [], [], []
+    for u, v, d in G.edges(data=True):
+        sources.append(u)
+        targets.append(v)
+        labels.append(d.get('label'))
+        weights.append(d.get('weight', 1))
+        source_docs.append(d.get('source_doc'))
+    edges = pa.table({
+        'source': pa.array(sources, type=pa.string()),
+        'target': pa.array(targets, type=pa.string()),
+        'label': pa.array(labels, type=pa.string()),
+        'weight': pa.array(weights, type=pa.int32()),
+        'source_doc': pa.array(source_docs, type=pa.string()),
+    })
+    return _dictionary_encode(nodes, NODE_DICTIONARY_COLUMNS), _dictionary_encode(edges, EDGE_DICTIONARY_COLUMNS)
+
+def write_graph_parquet(G, nodes_path=NODES_PARQUET, edges_path=EDGES_PARQUET):
+    """Writes the knowledge graph as node and edge Parquet tables."""
+    nodes, edges = graph_to_tables(G)
+    pq.write_table(nodes, nodes_path, compression=PARQUET_COMPRESSION)
+    pq.write_table(edges, edges_path, compression=PARQUET_COMPRESSION)
+
+def _metadata_column(name, values):
+    """
+    One chunk metadata column (None where a chunk lacks the key). Keys whose values have
+    more than one type, or that Arrow cannot type, are stored as JSON strings instead.
+    """
+    value_types = {type(v) for v in values if v is not None}
+    if len(value_types) <= 1:
+        try:
+            array = pa.array(values)
+            return pa.field(name, array.type), array
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    encoded = [json.dumps(v) if v is not None else None for v in values]
+    return pa.field(name, pa.string(), metadata=JSON_FIELD_METADATA), pa.array(encoded, type=pa.string())
+
+def write_chunks_parquet(chunks, path=CHUNKS_PARQUET):
+    """
+    Writes the text chunk corpus (the builder's input JSON: [{'text', 'metadata'}, ...])
+    as a Parquet table with one column per metadata key. The schema is built from the union
+    of keys over all chunks, not inferred from the first one, so no metadata is dropped.
+    """
+    metadata = [chunk.get('metadata', {}) for chunk in chunks]
+    keys = list(dict.fromkeys(key for m in metadata for key in m if key != 'text'))
+    fields = [pa.field('text', pa.string())]
+    arrays = [pa.array([chunk.get('text', '') for chunk in chunks], type=pa.string())]
+    for key in keys:
+        field, array = _metadata_column(key, [m.get(key) for m in metadata])
+        fields.append(field)
+        arrays.append(array)
+    table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+    pq.write_table(_dictionary_encode(table, CHUNK_DICTIONARY_COLUMNS), path, compression=PARQUET_COMPRESSION)
+
+# --- Readers ---
+
+def _column_to_list(column):
+    """
+    Converts an Arrow column to a Python list. Dictionary columns are decoded through
+    their indices so every repeated value shares one Python string object, which is
+    both much faster than to_pylist() and lighter on memory.
+    """
+    if not pa.types.is_dictionary(column.type):
+        return column.to_pylist()
+    values = []
+    for chunk in column.chunks:
+        dictionary = chunk.dictionary.to_pylist()
+        values.extend(dictionary[i] if i is not None else None for i in chunk.indices.to_pylist())
+    return values
+
+def read_graph_parquet(nodes_path=NODES_PARQUET, edges_path=EDGES_PARQUET):
+    """
+    Rebuilds the API's in-memory NetworkX graph from the Parquet tables.
+
+    Columns are converted to Python lists in bulk and handed to add_nodes_from /
+    add_edges_from, avoiding per-record JSON parsing.
+    """
+    nodes = pq.read_table(nodes_path)
+    edges = pq.read_table(edges_path)
+
+    G = nx.Graph()
+    ids = nodes.column('id').to_pylist()
+    labels = nodes.column('label').to_pylist()
+    types = _column_to_list(nodes.column('type'))
+    papers = nodes.column('papers').to_pylist()
+    G.add_nodes_from(
+        (node_id, {'label': label, 'type': node_type, 'papers': node_papers})
+        for node_id, label, node_type, node_papers in zip(ids, labels, types, papers)
+    )
+
+    columns = [_column_to_list(edges.column(name)) for name in ('source', 'target', 'label', 'weight', 'source_doc')]
+    G.add_edges_from(
+        (u, v, {'label': label, 'weight': weight, 'source_doc': source_doc})
+        for u, v, label, weight, source_doc in zip(*columns)
+    )
+    return G
+
+def read_chunks_parquet(path=CHUNKS_PARQUET):
+    """Reads the chunk corpus back into the builder's [{'text', 'metadata'}, ...] format."""
+    table = pq.read_table(path)
+    json_columns = [field.name for field in table.schema if (field.metadata or {}) == JSON_FIELD_METADATA]
+    chunks = []
+    for row in table.to_pylist():
+        text = row.pop('text')
+        metadata = {k: v for k, v in row.items() if v is not None}
+        for name in json_columns:
+            if name in metadata:
+                metadata[name] = json.loads(metadata[name])
+        chunks.append({'text': text, 'metadata': metadata})
+    return chunks
+
+# --- Benchmark ---
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def _size_mb(*paths):
+    return sum(os.path.getsize(p) for p in paths) / (1024 * 1024)
+
+def benchmark_formats(G, output_dir='format_benchmark'):
+    """
+    Writes the graph as indented JSON, GML and Parquet, then reloads each one.
+    Prints and returns write seconds, size in MB and load seconds per format.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, 'knowledge_graph.json')
+    gml_path = os.path.join(output_dir, 'knowledge_graph.gml')
+    nodes_path = os.path.join(output_dir, NODES_PARQUET)
+    edges_path = os.path.join(output_dir, EDGES_PARQUET)
+
+    def write_json():
+        with open(json_path, 'w') as f:
+            json.dump(nx.node_link_data(G), f, indent=2)
+
+    def load_json():
+        with open(json_path, 'r') as f:
+            return nx.node_link_graph(json.load(f))
+
+    results = {}
+    _, write_s = _timed(write_json)
+    _, load_s = _timed(load_json)
+    results['json'] = (write_s, _size_mb(json_path), load_s)
+
+    _, write_s = _timed(nx.write_gml, G, gml_path)
+    _, load_s = _timed(nx.read_gml, gml_path)
+    results['gml'] = (write_s, _size_mb(gml_path), load_s)
+
+    _, write_s = _timed(write_graph_parquet, G, nodes_path, edges_path)
+    _, load_s = _timed(read_graph_parquet, nodes_path, edges_path)
+    results['parquet'] = (write_s, _size_mb(nodes_path, edges_path), load_s)
+
+    print(f"Graph: Nodes: {G.number_of_nodes()}, Edges: {G.number_of_edges()}")
+    print(f"{'format':<10}{'write (s)':>12}{'size (MB)':>12}{'load (s)':>12}")
+    for name, (write_s, size_mb, load_s) in results.items():
+        print(f"{name:<10}{write_s:>12.3f}{size_mb:>12.2f}{load_s:>12.3f}")
+    return results
+
+
+if __name__ == '__main__':
+    from knowledge_graph_builder import OUTPUT_GRAPH_FILE, INPUT_CHUNKS_FILE, load_text_chunks
+
+    print("--- Knowledge Graph Columnar Export Started ---")
+    if not os.path.exists(OUTPUT_GRAPH_FILE):
+        print(f"FATAL ERROR: Knowledge graph not found at '{OUTPUT_GRAPH_FILE}'. Run knowledge_graph_builder.py first.")
+        raise SystemExit(1)
+
+    with open(OUTPUT_GRAPH_FILE, 'r') as f:
+        graph = nx.node_link_graph(json.load(f))
+    write_graph_parquet(graph)
+    print(f"✅ Knowledge Graph (Parquet) saved to: {NODES_PARQUET}, {EDGES_PARQUET}")
+
+    chunks = load_text_chunks(INPUT_CHUNKS_FILE)
+    if chunks:
+        write_chunks_parquet(chunks)
+        print(f"✅ Chunk corpus (Parquet) saved to: {CHUNKS_PARQUET}")
+
+    benchmark_formats(graph)
@@ -0,0 +1,272 @@
+"""
+Background jobs that rebuild the knowledge graph and/or the vector index into a new
+version directory (see index_versions.py) without stopping the API.
+
+Job kinds:
+    kg_build  rebuild the KG from a chunk file with the NER model; the vector index is carried over
+    ingest    embed a chunk file into ChromaDB (mode "replace": new index, "append": upsert into
+              a copy of the current one); the KG is carried over
+    refresh   both, from the same chunk file
+
+Each job runs in its own (spawned, lower-priority) process, so NER inference and embedding
+never compete with the API's event loop or GIL. The process reports progress through a
+small JSON file in the version directory; the API polls it, and when the process exits
+successfully hands the version to the `activate` callback, which swaps it in.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import multiprocessing
+from index_versions import VERSION_MANIFEST, new_version_id, version_path, write_version_manifest
+from kg_columnar import NODES_PARQUET, EDGES_PARQUET, CHUNKS_PARQUET
+
+JOB_KINDS = ("kg_build", "ingest", "refresh")
+INGEST_MODES = ("replace", "append")
+PROGRESS_FILE = 'job_progress.json'
+KG_FILES = (NODES_PARQUET, EDGES_PARQUET, 'knowledge_graph.json', CHUNKS_PARQUET)
+CHROMA_DIR_NAME = 'chroma_db'
+POLL_INTERVAL_S = 0.5
+JOB_NICENESS = 10 # Job processes yield the CPU to the serving process
+JOB_TORCH_THREADS = os.getenv('JOB_TORCH_THREADS', '2')
+INGEST_BATCH_SIZE = 256
+ENCODE_BATCH_SIZE = 64
+MAX_JOB_HISTORY = 50
+
+
+class JobConflict(Exception):
+    """Raised when a job is started while another one is still running."""
+
+
+# --- Job Process ---
+
+class ProgressReporter:
+    """Writes {stage, done, total, error} atomically so the API never reads a half-written file."""
+
+    def __init__(self, version_dir):
+        self.path = os.path.join(version_dir, PROGRESS_FILE)
+
+    def update(self, stage, done=0, total=0, error=None):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({"stage": stage, "done": done, "total": total, "error": error}, f)
+        os.replace(tmp_path, self.path)
+
+
+def read_progress(version_dir):
+    try:
+        with open(os.path.join(version_dir, PROGRESS_FILE), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def copy_kg_files(source_dir, version_dir):
+    for name in KG_FILES:
+        if os.path.exists(os.path.join(source_dir, name)):
+            shutil.copy2(os.path.join(source_dir, name), os.path.join(version_dir, name))
+
+
+def copy_vector_index(source_dir, version_dir):
+    source = os.path.join(source_dir, CHROMA_DIR_NAME)
+    if os.path.isdir(source):
+        shutil.copytree(source, os.path.join(version_dir, CHROMA_DIR_NAME))
+
+
+def chunk_id(chunk, position):
+    """Stable id, so re-ingesting the same chunk upserts instead of duplicating it."""
+    metadata = chunk.get('metadata', {})
+    if 'document_filename' in metadata and 'chunk_index' in metadata:
+        return f"{metadata['document_filename']}#{metadata['chunk_index']}"
+    return hashlib.sha1(chunk.get('text', str(position)).encode('utf-8')).hexdigest()
+
+
+def ingest_chunks(chunks, chroma_dir, collection_name, embedding_model, progress):
+    """Embeds the chunks in batches and upserts them into the collection at chroma_dir."""
+    from chromadb import PersistentClient
+    from sentence_transformers import SentenceTransformer
+
+    client = PersistentClient(path=chroma_dir)
+    collection = client.get_or_create_collection(name=collection_name)
+    model = SentenceTransformer(embedding_model)
+    for start in range(0, len(chunks), INGEST_BATCH_SIZE):
+        progress.update("ingest", start, len(chunks))
+        batch = [c for c in chunks[start:start + INGEST_BATCH_SIZE] if c.get('text')]
+        if not batch:
+            continue
+        texts = [c['text'] for c in batch]
+        collection.upsert(
+            ids=[chunk_id(c, start + i) for i, c in enumerate(batch)],
+            documents=texts,
+            metadatas=[
+                {k: v for k, v in c.get('metadata', {}).items() if isinstance(v, (str, int, float, bool))}
+                or {"document_filename": "UNKNOWN"}
+                for c in batch
+            ],
+            embeddings=model.encode(texts, batch_size=ENCODE_BATCH_SIZE).tolist(),
+        )
+    progress.update("ingest", len(chunks), len(chunks))
+    return collection.count()
+
+
+def run_job(kind, version, version_dir, source_dir, params):
+    """Entry point of the job process."""
+    if hasattr(os, 'nice'):
+        os.nice(JOB_NICENESS)
+    os.environ.setdefault('OMP_NUM_THREADS', JOB_TORCH_THREADS)
+    progress = ProgressReporter(version_dir)
+    try:
+        chunks_file = params["chunks_file"]
+        manifest = {"version": version, "kind": kind, "chunks_file": chunks_file, "started": time.time()}
+
+        progress.update("copy")
+        if kind == "kg_build" or params.get("mode") == "append":
+            copy_vector_index(source_dir, version_dir)
+        if kind == "ingest":
+            copy_kg_files(source_dir, version_dir)
+
+        if kind in ("kg_build", "refresh"):
+            from knowledge_graph_builder import build_knowledge_graph
+            G = build_knowledge_graph(
+                chunks_file, version_dir, progress=lambda done, total: progress.update("kg_build", done, total)
+            )
+            if G is None:
+                raise RuntimeError("Knowledge graph build failed (see the API log).")
+            manifest["kg_nodes"], manifest["kg_edges"] = G.number_of_nodes(), G.number_of_edges()
+
+        if kind in ("ingest", "refresh"):
+            with open(chunks_file, 'r', encoding='utf-8') as f:
+                chunks = json.load(f)
+            manifest["indexed_chunks"] = ingest_chunks(
+                chunks, os.path.join(version_dir, CHROMA_DIR_NAME),
+                params["collection_name"], params["embedding_model"], progress,
+            )
+
+        manifest["finished"] = time.time()
+        write_version_manifest(version_dir, manifest) # Marks the version as complete
+        progress.update("done", 1, 1)
+    except Exception as e:
+        progress.update("failed", error=f"{type(e).__name__}: {e}")
+        sys.exit(1)
+
+
+# --- Job Runner (API side) ---
+
+class Job:
+    def __init__(self, kind, params, version, version_dir):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.version = version
+        self.version_dir = version_dir
+        self.status = "running" # running -> activating -> succeeded | failed | cancelled
+        self.progress = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.process = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": {k: v for k, v in self.params.items() if k in ("chunks_file", "mode")},
+            "version": self.version,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobRunner:
+    """Starts, tracks and cancels job processes; one job runs at a time."""
+
+    def __init__(self, versions_dir, activate):
+        self.versions_dir = versions_dir
+        self.activate = activate # async callable(version) that loads and swaps in a finished version
+        self.jobs = {}
+        self.tasks = set() # asyncio keeps only weak references to tasks
+        self.context = multiprocessing.get_context('spawn') # No forked copies of torch/Chroma state
+
+    def running(self):
+        return [job for job in self.jobs.values() if job.status in ("running", "activating")]
+
+    def start(self, kind, params, source_version):
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'. Expected one of {JOB_KINDS}.")
+        if params.get("mode", "replace") not in INGEST_MODES:
+            raise ValueError(f"Unknown ingest mode '{params['mode']}'. Expected one of {INGEST_MODES}.")
+        if not os.path.exists(params["chunks_file"]):
+            raise ValueError(f"Chunk file not found: {params['chunks_file']}")
+        if self.running():
+            raise JobConflict(f"Job {self.running()[0].id} is still running.")
+
+        version = new_version_id()
+        version_dir = os.path.join(self.versions_dir, version)
+        os.makedirs(version_dir)
+        job = Job(kind, params, version, version_dir)
+        job.process = self.context.Process(
+            target=run_job,
+            args=(kind, version, version_dir, version_path(self.versions_dir, source_version), params),
+            name=f"kg-job-{job.id}",
+            daemon=True,
+        )
+        job.process.start()
+        self.jobs[job.id] = job
+        self._trim_history()
+        task = asyncio.get_running_loop().create_task(self._monitor(job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    async def _monitor(self, job):
+        while job.process.is_alive():
+            job.progress = await asyncio.to_thread(read_progress, job.version_dir) or job.progress
+            await asyncio.sleep(POLL_INTERVAL_S)
+        job.process.join()
+        job.progress = read_progress(job.version_dir) or job.progress
+
+        if job.status == "cancelled":
+            pass
+        elif job.process.exitcode != 0 or not os.path.exists(os.path.join(job.version_dir, VERSION_MANIFEST)):
+            job.status = "failed"
+            job.error = (job.progress or {}).get("error") or f"Job process exited with code {job.process.exitcode}."
+        else:
+            job.status = "activating"
+            try:
+                await self.activate(job.version)
+                job.status = "succeeded"
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"Activation failed: {e}"
+
+        job.finished = time.time()
+        if job.status != "succeeded":
+            await asyncio.to_thread(shutil.rmtree, job.version_dir, True)
+        print(f"KG job {job.id} ({job.kind}) {job.status}." + (f" {job.error}" if job.error else ""))
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        if job.status == "running":
+            job.status = "cancelled"
+            job.process.terminate()
+        return job
+
+    def shutdown(self):
+        for job in self.running():
+            job.status = "cancelled"
+            job.process.terminate()
+
+    def building_versions(self):
+        return {job.version for job in self.running()}
+
+    def _trim_history(self):
+        finished = [job for job in self.jobs.values() if job.finished is not None]
+        for job in sorted(finished, key=lambda j: j.created)[:max(0, len(self.jobs) - MAX_JOB_HISTORY)]:
+            del self.jobs[job.id]
@@ -3,12 +3,17 @@ import json
 import re
 import networkx as nx
 from transformers import pipeline, AutoTokenizer, AutoModelForTokenClassification
+from kg_columnar import (
+    NODES_PARQUET, EDGES_PARQUET, CHUNKS_PARQUET, write_graph_parquet, write_chunks_parquet
+)
 
 # --- Configuration ---
-MODEL_DIR = r"C:\Users\Sameer Roy\Desktop\nsac\models\models\ner_v1_15papers"
+MODEL_DIR = os.getenv('NER_MODEL_DIR', '../models/models/ner_v1_15papers') # Same model the API serves
 INPUT_CHUNKS_FILE = 'pone.0104830_LS_Tasks.json'
 OUTPUT_GRAPH_FILE = 'knowledge_graph.json'
 OUTPUT_GRAPH_GML = 'knowledge_graph.gml' # Alternative format for visualization tools
+WRITE_GML = False # GML writing dominates build time on large graphs; enable only when a tool needs it
+PROGRESS_EVERY = 50 # Chunks between progress callbacks
 
 # --- Helper Functions ---
 
@@ -27,7 +32,11 @@ def clean_entity_name(name):
 
 # --- Main Graph Construction ---
 
-def build_knowledge_graph():
+def build_knowledge_graph(input_chunks_file=INPUT_CHUNKS_FILE, output_dir='.', progress=None):
+    """
+    Builds the KG from the chunk corpus and writes it (Parquet, JSON, chunks.parquet) to output_dir.
+    `progress(done, total)` is called every PROGRESS_EVERY chunks (used by the API's job runner).
+    """
     print("--- Phase II, Step 5: Knowledge Graph Builder Started ---")
 
     # 1. Load Trained NER Pipeline
@@ -45,9 +54,10 @@ def build_knowledge_graph():
         return
 
     # 2. Load Input Data
-    all_chunks = load_text_chunks(INPUT_CHUNKS_FILE)
+    all_chunks = load_text_chunks(input_chunks_file)
     if not all_chunks:
         return
+    os.makedirs(output_dir, exist_ok=True)
 
     # 3. Initialize Graph and Entity Tracking
     G = nx.Graph()
@@ -57,7 +67,9 @@ def build_knowledge_graph():
     # 4. Process Chunks and Extract Entities
     print(f"Processing {len(all_chunks)} text chunks to extract entities...")
     
-    for chunk in all_chunks:
+    for chunk_number, chunk in enumerate(all_chunks):
+        if progress and chunk_number % PROGRESS_EVERY == 0:
+            progress(chunk_number, len(all_chunks))
         text = chunk.get('text', '')
         metadata = chunk.get('metadata', {})
         document_id = metadata.get('document_filename', 'UNKNOWN')
@@ -117,15 +129,29 @@ def build_knowledge_graph():
     # 6. Save the Graph
     print(f"Graph construction complete. Nodes: {G.number_of_nodes()}, Edges: {G.number_of_edges()}")
     
-    # Save as JSON (Node-Link format) for easy loading in FastAPI
+    if progress:
+        progress(len(all_chunks), len(all_chunks))
+
+    # Save as Parquet (columnar) - the fast load path used by FastAPI
+    nodes_path, edges_path = os.path.join(output_dir, NODES_PARQUET), os.path.join(output_dir, EDGES_PARQUET)
+    write_graph_parquet(G, nodes_path, edges_path)
+    print(f"✅ Knowledge Graph (Parquet) saved to: {nodes_path}, {edges_path}")
+    chunks_path = os.path.join(output_dir, CHUNKS_PARQUET)
+    write_chunks_parquet(all_chunks, chunks_path)
+    print(f"✅ Chunk corpus (Parquet) saved to: {chunks_path}")
+
+    # Save as JSON (Node-Link format) as a portable fallback; compact, since indentation only adds size
     graph_data = nx.node_link_data(G)
-    with open(OUTPUT_GRAPH_FILE, 'w') as f:
-        json.dump(graph_data, f, indent=2)
-    print(f"✅ Knowledge Graph (JSON) saved to: {OUTPUT_GRAPH_FILE}")
+    graph_path = os.path.join(output_dir, OUTPUT_GRAPH_FILE)
+    with open(graph_path, 'w') as f:
+        json.dump(graph_data, f, separators=(',', ':'))
+    print(f"✅ Knowledge Graph (JSON) saved to: {graph_path}")
     
     # Optional: Save in GML format for external graph visualization tools
-    nx.write_gml(G, OUTPUT_GRAPH_GML)
-    print(f"✅ Knowledge Graph (GML) saved to: {OUTPUT_GRAPH_GML}")
+    if WRITE_GML:
+        nx.write_gml(G, os.path.join(output_dir, OUTPUT_GRAPH_GML))
+        print(f"✅ Knowledge Graph (GML) saved to: {os.path.join(output_dir, OUTPUT_GRAPH_GML)}")
+    return G
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+"""
+Loads the NER model variant the API should serve.
+
+ner_export.py (backend/models) writes quantized/ONNX variants of the trained model under
+<MODEL_DIR>/variants/ together with a report of F1, size and latency per variant.
+The API names the variant it wants via NER_MODEL_VARIANT:
+
+    fp32       original PyTorch checkpoint (transformers pipeline)
+    int8       dynamic-quantized PyTorch model (transformers pipeline)
+    onnx       ONNX Runtime, fp32
+    onnx-int8  ONNX Runtime, int8-quantized
+    auto       the report's recommended variant (fastest within the F1 tolerance)
+
+Every loader returns a callable with the transformers "ner" pipeline output format
+(a list of {'entity', 'score', 'index', 'word', 'start', 'end'} per labeled token),
+so get_ner_entities() is unchanged whichever variant is served.
+"""
+import os
+import json
+import numpy as np
+from transformers import pipeline, AutoConfig, AutoTokenizer, AutoModelForTokenClassification
+try:
+    import torch
+except ImportError:
+    torch = None
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+VARIANTS_DIR_NAME = 'variants'
+REPORT_FILE = 'report.json'
+NER_VARIANTS = ("fp32", "int8", "onnx", "onnx-int8")
+
+
+class OnnxNerPipeline:
+    """Minimal ONNX Runtime stand-in for transformers' token-classification pipeline (no aggregation)."""
+
+    def __init__(self, variant_dir):
+        self.tokenizer = AutoTokenizer.from_pretrained(variant_dir)
+        self.id2label = {int(k): v for k, v in AutoConfig.from_pretrained(variant_dir).id2label.items()}
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(variant_dir, 'model.onnx'), options, providers=['CPUExecutionProvider']
+        )
+
+    def __call__(self, text):
+        encoded = self.tokenizer(
+            text, truncation=True, return_offsets_mapping=True, return_special_tokens_mask=True, return_tensors='np'
+        )
+        logits = self.session.run(['logits'], {
+            'input_ids': encoded['input_ids'].astype(np.int64),
+            'attention_mask': encoded['attention_mask'].astype(np.int64),
+        })[0][0]
+        scores = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        scores /= scores.sum(axis=-1, keepdims=True)
+
+        input_ids = encoded['input_ids'][0]
+        entities = []
+        for index, label_id in enumerate(scores.argmax(axis=-1)):
+            label = self.id2label[int(label_id)]
+            if encoded['special_tokens_mask'][0][index] or label == 'O':
+                continue
+            start, end = encoded['offset_mapping'][0][index]
+            entities.append({
+                'entity': label,
+                'score': float(scores[index, label_id]),
+                'index': index,
+                'word': self.tokenizer.convert_ids_to_tokens(int(input_ids[index])),
+                'start': int(start),
+                'end': int(end),
+            })
+        return entities
+
+
+def read_export_report(model_dir):
+    """Returns the ner_export.py report for model_dir, or None if the model has not been exported."""
+    report_path = os.path.join(model_dir, VARIANTS_DIR_NAME, REPORT_FILE)
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path, 'r') as f:
+        return json.load(f)
+
+
+def resolve_variant(model_dir, requested):
+    """Maps the configured variant name (including 'auto') to a variant that exists on disk."""
+    if requested == "auto":
+        report = read_export_report(model_dir)
+        requested = report["recommended"] if report else "fp32"
+    if requested not in NER_VARIANTS:
+        print(f"Unknown NER variant '{requested}', falling back to fp32.")
+        return "fp32"
+    if requested != "fp32" and not os.path.isdir(os.path.join(model_dir, VARIANTS_DIR_NAME, requested)):
+        print(f"NER variant '{requested}' has not been exported, falling back to fp32.")
+        return "fp32"
+    if requested.startswith("onnx") and ort is None:
+        print("onnxruntime is not installed, falling back to fp32.")
+        return "fp32"
+    return requested
+
+
+def load_ner_variant(model_dir, requested="auto"):
+    """Returns (ner_callable, variant_name) for the requested variant of the model in model_dir."""
+    variant = resolve_variant(model_dir, requested)
+    variant_dir = os.path.join(model_dir, VARIANTS_DIR_NAME, variant)
+
+    if variant == "fp32":
+        return pipeline("ner", model=model_dir, tokenizer=model_dir), variant
+    if variant == "int8":
+        # Rebuild the fp32 architecture, quantize it the same way ner_export.py did, then load the int8 weights
+        model = AutoModelForTokenClassification.from_config(AutoConfig.from_pretrained(variant_dir))
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.load_state_dict(torch.load(os.path.join(variant_dir, 'model_int8.pt')))
+        model.eval()
+        return pipeline("ner", model=model, tokenizer=AutoTokenizer.from_pretrained(variant_dir)), variant
+    return OnnxNerPipeline(variant_dir), variant
@@ -0,0 +1,128 @@
+"""
+On-demand sampling profiler and slow-request log for the API.
+
+SamplingProfiler samples the Python stacks of every thread at a fixed interval and
+aggregates them into the "collapsed stack" format (`frame;frame;frame count` per line)
+that flamegraph.pl, speedscope and inferno read directly. The root frame of each stack
+is the thread name, so event-loop time is separated from the asyncio.to_thread workers
+running NER, ChromaDB and Gemini calls. C code that releases the GIL (tokenizers, torch,
+SQLite, time.sleep) is attributed to the Python line that called it.
+
+SlowRequestLog keeps the per-stage spans of requests slower than a threshold in a
+bounded ring buffer.
+"""
+import sys
+import time
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+
+DEFAULT_INTERVAL_S = 0.01
+MAX_STACK_DEPTH = 128
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+class SamplingProfiler:
+    """
+    Samples all thread stacks from its own daemon thread (not the shared executor used by
+    the request pipeline); one profile runs at a time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def start(self, duration_s: float, interval_s: float = DEFAULT_INTERVAL_S) -> Future:
+        """Starts a profile; the returned future resolves to (collapsed stacks, summary)."""
+        if not self.lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running.")
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self._sample(duration_s, interval_s))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.lock.release()
+
+        threading.Thread(target=run, name="sampling-profiler", daemon=True).start()
+        return future
+
+    def _sample(self, duration_s, interval_s):
+        stacks = Counter()
+        own_id = threading.get_ident()
+        samples = 0
+        overhead_s = 0.0
+        deadline = time.perf_counter() + duration_s
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stacks[collapse(names.get(thread_id, f"thread-{thread_id}"), frame)] += 1
+            samples += 1
+            elapsed = time.perf_counter() - start
+            overhead_s += elapsed
+            time.sleep(max(0.0, interval_s - elapsed))
+
+        collapsed = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        summary = {
+            "duration_s": duration_s,
+            "interval_ms": interval_s * 1000,
+            "samples": samples,
+            "distinct_stacks": len(stacks),
+            "sampler_cpu_share": round(overhead_s / duration_s, 4) if duration_s else None,
+        }
+        return collapsed, summary
+
+
+def collapse(thread_name: str, frame) -> str:
+    """Root-first `thread;func@file:line;...` rendering of a frame's stack."""
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        filename = code.co_filename.replace('\\', '/').rsplit('/', 1)[-1]
+        frames.append(f"{code.co_name}@{filename}:{frame.f_lineno}")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames)).replace(" ", "_") # The count follows the last space
+
+
+class SlowRequestLog:
+    """Bounded ring buffer of traces of requests slower than threshold_ms."""
+
+    def __init__(self, threshold_ms: float, max_entries: int):
+        self.threshold_ms = threshold_ms
+        self.entries = deque(maxlen=max_entries)
+        self.recorded = 0
+
+    def maybe_record(self, arrival: float, question: str, route: str, status_code: int, trace) -> bool:
+        total_ms = trace.elapsed_ms()
+        if total_ms < self.threshold_ms:
+            return False
+        self.recorded += 1
+        self.entries.append({
+            "t": round(arrival, 3),
+            "question": question[:200],
+            "route": route,
+            "status": status_code,
+            "ms": round(total_ms, 1),
+            "spans": [
+                {"stage": name, "start_ms": round(start, 1), "ms": round(duration, 1),
+                 "cpu_ms": round(cpu, 1) if cpu is not None else None}
+                for name, start, duration, cpu in sorted(trace.spans, key=lambda span: span[1])
+            ],
+        })
+        return True
+
+    def query(self, limit: int, min_ms: float = 0.0, route: str = None) -> list[dict]:
+        """Newest first, optionally filtered by latency and route."""
+        matches = [
+            entry for entry in reversed(self.entries)
+            if entry["ms"] >= min_ms and (route is None or entry["route"] == route)
+        ]
+        return matches[:limit]
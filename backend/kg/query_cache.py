@@ -0,0 +1,74 @@
+"""
+In-process caches for the /ask pipeline: query embeddings, ChromaDB retrieval results
+and final answers, all keyed by the normalized question (plus filters).
+"""
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+def normalize_question(question: str) -> str:
+    """Case/whitespace/trailing-punctuation-insensitive form of a question, used as the cache key."""
+    return re.sub(r'\s+', ' ', question).strip().rstrip('?!. ').lower()
+
+
+def query_cache_key(question: str, filters: dict) -> str:
+    return json.dumps([normalize_question(question), filters or {}], sort_keys=True, separators=(',', ':'))
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time-to-live.
+
+    Used from the event loop and from worker threads (embeddings are computed inside
+    ChromaDB's query call), hence the lock.
+    """
+
+    def __init__(self, max_size: int, ttl_s: float):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_s, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+            }
@@ -0,0 +1,312 @@
+"""
+Retrieval quality vs latency benchmark for the /ask RAG path.
+
+1. Bootstraps labeled question -> relevant-chunk pairs: every entity annotated in the CoNLL
+   training data becomes a question, and the chunks of pone.0104830_LS_Tasks.json that mention
+   the entity are its relevant set. The pairs are saved to retrieval_eval/labeled_questions.json
+   and reused (and can be curated by hand) on later runs.
+2. Embeds the chunk corpus once per embedding model, timing each encode batch size.
+3. Builds an in-memory ChromaDB index per HNSW setting and runs every question for each k,
+   without a filter (what /ask does today), and with the entity's document filter either
+   pushed down into ChromaDB (`where`) or applied afterwards to an over-fetched result list.
+   The filtered arms use the ground-truth documents, so they are an upper bound for KG filtering.
+4. Reports recall@k, MRR, p50/p99 query latency (question embedding + search) and index memory
+   per configuration, and marks the Pareto-optimal ones per k (recall up, latency down, memory down).
+
+Results are written to retrieval_eval/report.json.
+"""
+import os
+import re
+import gc
+import json
+import time
+import threading
+import numpy as np
+import chromadb
+from sentence_transformers import SentenceTransformer
+from kg_columnar import CHUNKS_PARQUET, read_chunks_parquet
+
+# --- Configuration ---
+CONLL_FILE = '../data/labeled_data_15_papers.conll'
+INPUT_CHUNKS_FILE = 'pone.0104830_LS_Tasks.json'
+OUTPUT_DIR = 'retrieval_eval'
+LABELED_FILE = os.path.join(OUTPUT_DIR, 'labeled_questions.json')
+REPORT_FILE = os.path.join(OUTPUT_DIR, 'report.json')
+
+EMBEDDING_MODELS = os.getenv('EVAL_EMBEDDING_MODELS', 'sentence-transformers/all-MiniLM-L6-v2').split(',')
+K_VALUES = (1, 3, 5, 10, 20) # Production uses n_results=5
+ENCODE_BATCH_SIZES = (16, 32, 64, 128)
+HNSW_CONFIGS = [ # ChromaDB collection metadata; the first entry is ChromaDB's default
+    {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 10},
+    {"hnsw:space": "l2", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 50},
+    {"hnsw:space": "l2", "hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 100},
+    {"hnsw:space": "cosine", "hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 50},
+]
+FILTER_MODES = ("none", "postfilter", "pushdown") # "none" matches the current /ask path
+POSTFILTER_OVERSAMPLE = 4 # Without pushdown, fetch k * this many results, then filter
+
+# Bootstrap limits
+MIN_ENTITY_KEY_CHARS = 5 # Shorter entities match too many chunks by accident
+MAX_ENTITY_WORDS = 8
+MAX_RELEVANT_CHUNKS = 25 # Entities mentioned everywhere don't discriminate between chunks
+QUESTION_TEMPLATE = "What does the research report about {entity}?"
+
+# --- Labeled Data Bootstrap ---
+
+def match_key(text):
+    """Lowercase alphanumerics only, so entities match chunks despite PDF spacing/tokenization artifacts."""
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+def detokenize(tokens):
+    text = ' '.join(tokens)
+    return re.sub(r'\s+([,.;:%)\]])', r'\1', re.sub(r'([(\[])\s+', r'\1', text))
+
+def read_conll_entities(file_path):
+    """Returns {entity text: entity type} for every B-/I- span in the CoNLL file."""
+    entities = {}
+    tokens, entity_type = [], None
+
+    def flush():
+        if tokens and len(tokens) <= MAX_ENTITY_WORDS:
+            entities.setdefault(detokenize(tokens), entity_type)
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            tag = parts[1] if len(parts) == 2 and not line.startswith('-DOCSTART-') else 'O'
+            if tag.startswith('I-') and tokens and tag[2:] == entity_type:
+                tokens.append(parts[0])
+                continue
+            flush()
+            tokens, entity_type = ([parts[0]], tag[2:]) if tag.startswith(('B-', 'I-')) else ([], None)
+    flush()
+    return entities
+
+def load_chunks():
+    """The chunk corpus, from chunks.parquet when knowledge_graph_builder.py has written it."""
+    if os.path.exists(CHUNKS_PARQUET):
+        return read_chunks_parquet(CHUNKS_PARQUET)
+    with open(INPUT_CHUNKS_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def bootstrap_labeled_questions(chunks):
+    """One question per CoNLL entity that is mentioned in 1..MAX_RELEVANT_CHUNKS chunks."""
+    chunk_keys = [match_key(chunk.get('text', '')) for chunk in chunks]
+    questions = []
+    for entity, entity_type in read_conll_entities(CONLL_FILE).items():
+        key = match_key(entity)
+        if len(key) < MIN_ENTITY_KEY_CHARS:
+            continue
+        relevant = [i for i, chunk_key in enumerate(chunk_keys) if key in chunk_key]
+        if not 1 <= len(relevant) <= MAX_RELEVANT_CHUNKS:
+            continue
+        documents = sorted({chunks[i].get('metadata', {}).get('document_filename', 'UNKNOWN') for i in relevant})
+        questions.append({
+            "question": QUESTION_TEMPLATE.format(entity=entity),
+            "entity": entity,
+            "entity_type": entity_type,
+            "relevant_chunks": relevant,
+            "documents": documents, # The entity -> papers filter the KG would supply
+        })
+    return questions
+
+def load_labeled_questions(chunks):
+    if os.path.exists(LABELED_FILE):
+        with open(LABELED_FILE, 'r') as f:
+            return json.load(f)
+    questions = bootstrap_labeled_questions(chunks)
+    with open(LABELED_FILE, 'w') as f:
+        json.dump(questions, f, indent=2)
+    print(f"Bootstrapped {len(questions)} labeled questions into {LABELED_FILE}.")
+    return questions
+
+# --- Measurement Helpers ---
+
+def current_rss_mb():
+    """Resident memory of this process (Linux), or None where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+class PeakRssSampler:
+    """Samples RSS in a background thread; `delta_mb` is the peak growth over the start value."""
+
+    def __init__(self, interval_s=0.01):
+        self.interval_s = interval_s
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval_s):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self):
+        if self.start_mb is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        if self.start_mb is not None:
+            self.thread.join()
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    @property
+    def delta_mb(self):
+        return round(self.peak_mb - self.start_mb, 1) if self.start_mb is not None else None
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+def chroma_metadata(metadata):
+    """ChromaDB only accepts scalar metadata values."""
+    return {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))} or {"source": "unknown"}
+
+# --- Sweeps ---
+
+def sweep_encode_batch_sizes(model, texts):
+    """Encodes the corpus at every batch size; returns the timings and the embeddings."""
+    results = []
+    embeddings = None
+    for batch_size in ENCODE_BATCH_SIZES:
+        with PeakRssSampler() as memory:
+            start = time.perf_counter()
+            embeddings = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+            seconds = time.perf_counter() - start
+        results.append({
+            "batch_size": batch_size,
+            "seconds": round(seconds, 3),
+            "chunks_per_s": round(len(texts) / seconds, 1),
+            "peak_rss_delta_mb": memory.delta_mb,
+        })
+        print(f"  encode batch_size={batch_size}: {results[-1]['chunks_per_s']} chunks/s")
+    return results, embeddings
+
+def build_index(client, name, hnsw_config, chunks, embeddings):
+    collection = client.create_collection(name=name, metadata=hnsw_config)
+    ids = [str(i) for i in range(len(chunks))]
+    for start in range(0, len(ids), 1000):
+        end = start + 1000
+        collection.add(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end].tolist(),
+            metadatas=[chroma_metadata(chunk.get('metadata', {})) for chunk in chunks[start:end]],
+        )
+    return collection
+
+def run_queries(model, collection, questions, k, filter_mode):
+    """Runs every labeled question with one of FILTER_MODES; returns recall@k, MRR and latency percentiles."""
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for item in questions:
+        documents = item["documents"]
+        start = time.perf_counter()
+        query_embedding = model.encode([item["question"]], convert_to_numpy=True).tolist()
+        if filter_mode == "none":
+            result = collection.query(query_embeddings=query_embedding, n_results=k, include=[])
+            retrieved = [int(i) for i in result['ids'][0]]
+        elif filter_mode == "pushdown":
+            result = collection.query(
+                query_embeddings=query_embedding, n_results=k,
+                where={"document_filename": {"$in": documents}}, include=[],
+            )
+            retrieved = [int(i) for i in result['ids'][0]]
+        else:
+            result = collection.query(
+                query_embeddings=query_embedding, n_results=k * POSTFILTER_OVERSAMPLE, include=['metadatas'],
+            )
+            retrieved = [
+                int(i) for i, meta in zip(result['ids'][0], result['metadatas'][0])
+                if meta.get('document_filename') in documents
+            ][:k]
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        relevant = set(item["relevant_chunks"])
+        recalls.append(len(relevant.intersection(retrieved)) / len(relevant))
+        rank = next((r for r, chunk in enumerate(retrieved, 1) if chunk in relevant), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    return {
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p99": percentile(latencies, 99),
+    }
+
+def mark_pareto_front(rows):
+    """
+    Flags configurations no other configuration with the same k beats on recall, p99 latency
+    and index memory at once. Fronts are per k: recall@20 always beats recall@1, so comparing
+    across k would only rank k values by their latency.
+    """
+    def objectives(row):
+        return (-row["recall_at_k"], row["latency_ms_p99"], row["index_memory_mb"] or 0.0)
+
+    for row in rows:
+        mine = objectives(row)
+        row["pareto"] = not any(
+            all(o <= m for o, m in zip(objectives(other), mine)) and objectives(other) != mine
+            for other in rows if other["k"] == row["k"]
+        )
+
+# --- Main Benchmark ---
+
+def evaluate_retrieval():
+    print("--- Retrieval Evaluation Started ---")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    chunks = load_chunks()
+    if not chunks:
+        print("FATAL ERROR: no chunks found. Run knowledge_graph_builder.py or provide the chunk JSON.")
+        return None
+    questions = load_labeled_questions(chunks)
+    if not questions:
+        print("FATAL ERROR: no labeled questions could be bootstrapped from the CoNLL entities.")
+        return None
+    texts = [chunk.get('text', '') for chunk in chunks]
+    print(f"{len(chunks)} chunks, {len(questions)} labeled questions.")
+
+    client = chromadb.EphemeralClient()
+    report = {"chunks": len(chunks), "questions": len(questions), "encode": {}, "configs": []}
+
+    for model_name in EMBEDDING_MODELS:
+        print(f"Embedding model: {model_name}")
+        model = SentenceTransformer(model_name)
+        report["encode"][model_name], embeddings = sweep_encode_batch_sizes(model, texts)
+
+        for index_number, hnsw_config in enumerate(HNSW_CONFIGS):
+            gc.collect()
+            with PeakRssSampler() as memory:
+                collection = build_index(client, f"eval_{index_number}", hnsw_config, chunks, embeddings)
+            for k in K_VALUES:
+                for filter_mode in FILTER_MODES:
+                    row = {
+                        "embedding_model": model_name,
+                        "hnsw": {key.split(':')[1]: value for key, value in hnsw_config.items()},
+                        "k": k,
+                        "filter": filter_mode,
+                        "index_memory_mb": memory.delta_mb,
+                        **run_queries(model, collection, questions, k, filter_mode),
+                    }
+                    report["configs"].append(row)
+            client.delete_collection(f"eval_{index_number}")
+
+    mark_pareto_front(report["configs"])
+    with open(REPORT_FILE, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'model':<24}{'space':>7}{'M':>4}{'ef':>5}{'k':>4}{'filter':>11}{'recall':>8}{'mrr':>7}"
+          f"{'p50 ms':>8}{'p99 ms':>8}{'mem MB':>8}  pareto")
+    for row in report["configs"]:
+        hnsw = row["hnsw"]
+        print(f"{row['embedding_model'].split('/')[-1][:23]:<24}{hnsw['space']:>7}{hnsw['M']:>4}{hnsw['search_ef']:>5}"
+              f"{row['k']:>4}{row['filter']:>11}{row['recall_at_k']:>8.3f}{row['mrr']:>7.3f}"
+              f"{row['latency_ms_p50']:>8.2f}{row['latency_ms_p99']:>8.2f}{str(row['index_memory_mb']):>8}"
+              f"  {'*' if row['pareto'] else ''}")
+    print(f"✅ Report saved to {REPORT_FILE}")
+    return report
+
+if __name__ == '__main__':
+    evaluate_retrieval()
@@ -0,0 +1,177 @@
+"""
+Opt-in traffic capture for /ask and the recorded-response LLM stub used to replay it.
+
+With TRAFFIC_CAPTURE_FILE set, every /ask request is appended as one JSON line:
+
+    t         arrival time (epoch seconds)
+    body      the request body (question, filters)
+    priority  / deadline_ms   the admission headers as sent
+    status    HTTP status returned
+    route     route code (see ROUTE_CODES in hybrid_api.py)
+    ms        total server-side latency
+    stages    per-stage timings in ms (ner, retrieval, llm, alignment, ...)
+    llm       the LLM's answer text, if the LLM was called
+
+traffic_replay.py reissues a capture against a running build. Starting that build with
+LLM_REPLAY_FILE pointing at the same capture swaps Gemini for RecordedLLM, which returns
+the recorded answers (after the recorded LLM latency), so replays are offline and deterministic.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from query_cache import query_cache_key
+
+
+class RequestTrace:
+    """Per-request stage timings, collected through the `current_trace` context variable."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.spans = [] # (stage, start offset ms, duration ms, thread CPU ms or None)
+        self.fields = {}
+
+    def finish(self):
+        """Freezes elapsed_ms() at the response time; the trace is written out later."""
+        self.finished = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return ((self.finished or time.perf_counter()) - self.started) * 1000
+
+    def stage_totals(self) -> dict:
+        totals = {}
+        for name, _, duration, _ in self.spans:
+            totals[name] = round(totals.get(name, 0.0) + duration, 1)
+        return totals
+
+
+# Context variables follow the request into asyncio.to_thread workers, so stages can be timed anywhere
+current_trace: ContextVar = ContextVar('current_trace', default=None)
+
+
+def in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times the enclosed block as `name` in the current request's trace (no-op outside a request).
+
+    Inside worker threads the span also records the thread's CPU time, so wall time far above
+    CPU time points at waiting (GIL, SQLite lock, network, sleep) rather than work. On the event
+    loop thread CPU time would include other requests, so it is left out.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    measure_cpu = not in_event_loop()
+    start = time.perf_counter()
+    cpu_start = time.thread_time() if measure_cpu else None
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        cpu_ms = (time.thread_time() - cpu_start) * 1000 if measure_cpu else None
+        trace.spans.append((name, (start - trace.started) * 1000, (end - start) * 1000, cpu_ms))
+
+
+def add_span(name: str, start: float):
+    """Records a stage that began at perf_counter() value `start` and ends now."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.spans.append((name, (start - trace.started) * 1000, (time.perf_counter() - start) * 1000, None))
+
+
+def annotate(key: str, value):
+    """Attaches a value (e.g. the LLM answer) to the current request's trace."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.fields[key] = value
+
+
+class TrafficCapture:
+    """Append-only JSON-lines capture of /ask traffic; stops recording once max_bytes is reached."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.full = False
+
+    def record(self, arrival: float, body: dict, priority, deadline_ms, status: int, route: str, trace: RequestTrace):
+        record = {
+            "t": round(arrival, 4),
+            "body": body,
+            "priority": priority,
+            "deadline_ms": deadline_ms,
+            "status": status,
+            "route": route,
+            "ms": round(trace.elapsed_ms(), 1),
+            "stages": trace.stage_totals(),
+        }
+        if "llm" in trace.fields:
+            record["llm"] = trace.fields["llm"]
+        line = json.dumps(record, separators=(',', ':'), ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.full:
+                return
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self.full = True
+                print(f"Traffic capture reached {self.max_bytes} bytes; recording stopped.")
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+def read_capture(path: str) -> list[dict]:
+    """Loads a capture file in arrival order, skipping partially written lines."""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+class RecordedLLM:
+    """
+    Stand-in for the Gemini call during replays: returns the answer recorded for the same
+    (normalized question, filters), after the recorded LLM latency times latency_scale.
+    """
+
+    MISSING_ANSWER = "[replay] No recorded LLM response for this question."
+
+    def __init__(self, capture_path: str, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self.responses = {}
+        for record in read_capture(capture_path):
+            if "llm" in record:
+                body = record["body"]
+                key = query_cache_key(body.get("question", ""), body.get("filters", {}))
+                self.responses.setdefault(key, (record["llm"], record["stages"].get("llm", 0.0)))
+        latencies = sorted(ms for _, ms in self.responses.values())
+        self.default_ms = latencies[len(latencies) // 2] if latencies else 0.0
+        self.misses = 0
+
+    async def generate(self, question: str, filters: dict) -> dict:
+        """Returns a Gemini-shaped response for the question."""
+        answer, llm_ms = self.responses.get(query_cache_key(question, filters), (None, self.default_ms))
+        if answer is None:
+            self.misses += 1
+            answer = self.MISSING_ANSWER
+        if self.latency_scale > 0 and llm_ms:
+            await asyncio.sleep(llm_ms * self.latency_scale / 1000)
+        return {"candidates": [{"content": {"parts": [{"text": answer}]}}]}
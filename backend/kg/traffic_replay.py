@@ -0,0 +1,152 @@
+"""
+Replays captured /ask traffic against a running build and compares runs.
+
+1. Capture production traffic: start the API with TRAFFIC_CAPTURE_FILE=traffic_capture.jsonl
+2. Start the build under test with the LLM stubbed out by the same capture:
+       LLM_REPLAY_FILE=traffic_capture.jsonl WARMUP_ENABLED=0 uvicorn hybrid_api:app
+3. Replay at the original rate (or --speed 2 for twice as fast) and save the run:
+       python traffic_replay.py replay traffic_capture.jsonl --label baseline --out run_baseline.json
+4. Repeat against the other build, then compare the two runs side by side:
+       python traffic_replay.py compare run_baseline.json run_candidate.json
+"""
+import json
+import time
+import argparse
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from traffic_capture import read_capture
+
+DEFAULT_URL = 'http://localhost:8000'
+MAX_IN_FLIGHT = 256 # Client threads; arrivals are never throttled by the client below this
+REQUEST_TIMEOUT_S = 300
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def send(session_local, base_url, record, scheduled_at, run_start):
+    """Issues one captured request at its scheduled time; returns the observed result."""
+    delay = scheduled_at - (time.perf_counter() - run_start)
+    if delay > 0:
+        time.sleep(delay)
+    session = getattr(session_local, 'session', None)
+    if session is None:
+        session = session_local.session = requests.Session()
+
+    headers = {}
+    if record.get("priority"):
+        headers["X-Request-Priority"] = record["priority"]
+    if record.get("deadline_ms"):
+        headers["X-Request-Deadline-Ms"] = str(record["deadline_ms"])
+
+    sent = time.perf_counter() - run_start
+    result = {"scheduled_s": round(scheduled_at, 4), "lag_ms": round((sent - scheduled_at) * 1000, 1)}
+    try:
+        response = session.post(f"{base_url}/ask", json=record["body"], headers=headers, timeout=REQUEST_TIMEOUT_S)
+        result["status"] = response.status_code
+        if response.ok:
+            result["source_type"] = response.json().get("source_type")
+    except requests.exceptions.RequestException as e:
+        result["status"] = 0
+        result["error"] = str(e)
+    result["ms"] = round((time.perf_counter() - run_start - sent) * 1000, 1)
+    return result
+
+
+def replay(capture_file, base_url=DEFAULT_URL, speed=1.0, label=None, limit=None):
+    """Reissues the captured requests with their original inter-arrival gaps divided by `speed`."""
+    records = read_capture(capture_file)[:limit]
+    if not records:
+        raise ValueError(f"No requests found in {capture_file}")
+    t0 = records[0]["t"]
+    local = threading.local()
+
+    print(f"Replaying {len(records)} requests from {capture_file} against {base_url} at {speed}x...")
+    run_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT) as pool:
+        futures = [
+            pool.submit(send, local, base_url, record, (record["t"] - t0) / speed, run_start)
+            for record in records
+        ]
+        results = [f.result() for f in futures]
+    duration = time.perf_counter() - run_start
+
+    return {
+        "label": label or base_url,
+        "capture_file": capture_file,
+        "base_url": base_url,
+        "speed": speed,
+        "captured_span_s": round(records[-1]["t"] - t0, 3),
+        "duration_s": round(duration, 3),
+        "requests": results,
+        "summary": summarize(results, duration),
+    }
+
+
+def summarize(results, duration_s):
+    ok = [r["ms"] for r in results if r["status"] == 200]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else None,
+        "statuses": statuses,
+        "throughput_rps": round(len(ok) / duration_s, 3) if duration_s > 0 else None,
+        "latency_ms_p50": percentile(ok, 50),
+        "latency_ms_p90": percentile(ok, 90),
+        "latency_ms_p99": percentile(ok, 99),
+        "latency_ms_max": max(ok) if ok else None,
+        "client_lag_ms_p99": percentile([r["lag_ms"] for r in results], 99),
+    }
+
+
+def compare(run_a, run_b):
+    """Prints the summaries of two runs side by side with the relative change."""
+    a, b = run_a["summary"], run_b["summary"]
+    print(f"{'metric':<20}{run_a['label'][:18]:>20}{run_b['label'][:18]:>20}{'change':>10}")
+    for metric in ("requests", "ok", "error_rate", "throughput_rps",
+                   "latency_ms_p50", "latency_ms_p90", "latency_ms_p99", "latency_ms_max", "client_lag_ms_p99"):
+        va, vb = a.get(metric), b.get(metric)
+        change = f"{(vb - va) / va * 100:+.1f}%" if va and vb is not None else "-"
+        print(f"{metric:<20}{str(va):>20}{str(vb):>20}{change:>10}")
+    if a["statuses"] != b["statuses"]:
+        print(f"statuses: {a['statuses']} vs {b['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_cmd = commands.add_parser('replay', help='reissue a capture against a running API')
+    replay_cmd.add_argument('capture_file')
+    replay_cmd.add_argument('--url', default=DEFAULT_URL)
+    replay_cmd.add_argument('--speed', type=float, default=1.0, help='rate multiplier (2 = twice the captured rate)')
+    replay_cmd.add_argument('--limit', type=int, default=None, help='replay only the first N requests')
+    replay_cmd.add_argument('--label', default=None)
+    replay_cmd.add_argument('--out', required=True, help='where to write the run (JSON)')
+
+    compare_cmd = commands.add_parser('compare', help='compare two saved runs')
+    compare_cmd.add_argument('run_a')
+    compare_cmd.add_argument('run_b')
+
+    args = parser.parse_args()
+    if args.command == 'replay':
+        run = replay(args.capture_file, args.url, args.speed, args.label, args.limit)
+        with open(args.out, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(json.dumps(run["summary"], indent=2))
+        print(f"✅ Run saved to {args.out}")
+    else:
+        with open(args.run_a) as fa, open(args.run_b) as fb:
+            compare(json.load(fa), json.load(fb))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+import torch
+from datasets import load_from_disk
+from transformers import AutoTokenizer, AutoModelForTokenClassification, DataCollatorForTokenClassification
+from ner_trainer import compute_metrics, DATA_DIR, OUTPUT_MODEL_DIR
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_dynamic as ort_quantize_dynamic, QuantType
+except ImportError:
+    ort = None
+
+# --- Configuration ---
+MODEL_DIR = OUTPUT_MODEL_DIR  # Trained model written by ner_trainer.py
+VARIANTS_DIR_NAME = 'variants'  # Export output: <MODEL_DIR>/variants/<variant>/
+REPORT_FILE = 'report.json'
+F1_TOLERANCE = float(os.getenv('NER_F1_TOLERANCE', '0.01'))  # Max absolute F1 drop vs fp32
+PRUNE_CHECKPOINTS = os.getenv('NER_PRUNE_CHECKPOINTS', '1') == '1'
+EVAL_BATCH_SIZE = 32
+LATENCY_SAMPLES = 100  # Single-sentence requests timed per variant (mirrors API usage)
+ONNX_OPSET = 14
+
+# --- Variant Export ---
+
+class LogitsOnly(torch.nn.Module):
+    """Wraps the token classifier so ONNX export sees a plain (input_ids, attention_mask) -> logits graph."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of all Linear layers (weights int8, activations quantized on the fly)."""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def export_int8(model, tokenizer, output_dir):
+    """Saves the dynamic-quantized state dict; loaders re-apply quantize_int8 to the fp32 architecture."""
+    os.makedirs(output_dir, exist_ok=True)
+    quantized = quantize_int8(model)
+    torch.save(quantized.state_dict(), os.path.join(output_dir, 'model_int8.pt'))
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    return quantized
+
+def export_onnx(model, tokenizer, output_dir):
+    """Exports an ONNX graph with dynamic batch and sequence axes, plus an int8-quantized copy."""
+    os.makedirs(output_dir, exist_ok=True)
+    onnx_path = os.path.join(output_dir, 'model.onnx')
+    sample = tokenizer(["microgravity bone loss"], return_tensors='pt')
+    torch.onnx.export(
+        LogitsOnly(model).eval(),
+        (sample['input_ids'], sample['attention_mask']),
+        onnx_path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['logits'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'logits': {0: 'batch', 1: 'sequence'},
+        },
+        opset_version=ONNX_OPSET,
+    )
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+    int8_dir = output_dir + '-int8'
+    os.makedirs(int8_dir, exist_ok=True)
+    ort_quantize_dynamic(onnx_path, os.path.join(int8_dir, 'model.onnx'), weight_type=QuantType.QInt8)
+    model.config.save_pretrained(int8_dir)
+    tokenizer.save_pretrained(int8_dir)
+    return onnx_path, os.path.join(int8_dir, 'model.onnx')
+
+# --- Evaluation ---
+
+def torch_predictor(model):
+    def predict(input_ids, attention_mask):
+        with torch.no_grad():
+            return model(
+                input_ids=torch.from_numpy(input_ids), attention_mask=torch.from_numpy(attention_mask)
+            ).logits.numpy()
+    return predict
+
+def onnx_predictor(onnx_path):
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def predict(input_ids, attention_mask):
+        return session.run(['logits'], {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+    return predict
+
+def evaluate_variant(predict, eval_dataset, tokenizer):
+    """
+    Runs compute_metrics (seqeval, as used during training) on the eval set.
+
+    All batches are padded to the eval set's longest sequence so the logits
+    can be stacked into the single array compute_metrics expects.
+    """
+    features = eval_dataset.remove_columns(
+        [c for c in eval_dataset.column_names if c not in ('input_ids', 'attention_mask', 'labels')]
+    )
+    max_length = max(len(ids) for ids in features['input_ids'])
+    collator = DataCollatorForTokenClassification(
+        tokenizer=tokenizer, padding='max_length', max_length=max_length, return_tensors='np'
+    )
+
+    all_logits, all_labels = [], []
+    for start in range(0, len(features), EVAL_BATCH_SIZE):
+        batch = collator([features[i] for i in range(start, min(start + EVAL_BATCH_SIZE, len(features)))])
+        all_logits.append(predict(batch['input_ids'].astype(np.int64), batch['attention_mask'].astype(np.int64)))
+        all_labels.append(batch['labels'])
+    return compute_metrics((np.concatenate(all_logits), np.concatenate(all_labels)))
+
+def measure_latency(predict, eval_dataset, samples=LATENCY_SAMPLES):
+    """Per-request CPU latency (batch of one sentence, no padding), in milliseconds."""
+    timings = []
+    count = min(samples, len(eval_dataset))
+    predict(np.array([eval_dataset[0]['input_ids']], dtype=np.int64),
+            np.array([eval_dataset[0]['attention_mask']], dtype=np.int64))  # warm-up
+    for i in range(count):
+        input_ids = np.array([eval_dataset[i]['input_ids']], dtype=np.int64)
+        attention_mask = np.array([eval_dataset[i]['attention_mask']], dtype=np.int64)
+        start = time.perf_counter()
+        predict(input_ids, attention_mask)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "latency_ms_p50": round(timings[len(timings) // 2], 2),
+        "latency_ms_p95": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+    }
+
+def size_mb(*paths):
+    return round(sum(os.path.getsize(p) for p in paths if os.path.exists(p)) / (1024 * 1024), 2)
+
+# --- Checkpoint Pruning ---
+
+def prune_checkpoints(model_dir):
+    """
+    Deletes intermediate Trainer checkpoint-* directories once the final model is saved
+    at the top level of model_dir. They duplicate the weights plus optimizer state.
+    """
+    has_final_model = os.path.exists(os.path.join(model_dir, 'config.json')) and any(
+        os.path.exists(os.path.join(model_dir, name)) for name in ('model.safetensors', 'pytorch_model.bin')
+    )
+    if not has_final_model:
+        print(f"⚠️ No final model found in {model_dir}; keeping checkpoints.")
+        return []
+    pruned = []
+    for name in sorted(os.listdir(model_dir)):
+        path = os.path.join(model_dir, name)
+        if name.startswith('checkpoint-') and os.path.isdir(path):
+            shutil.rmtree(path)
+            pruned.append(name)
+    return pruned
+
+# --- Main Export Pipeline ---
+
+def export_ner_model(model_dir=MODEL_DIR):
+    print("--- Phase II, Step 4b: NER Model Export Started ---")
+
+    if not os.path.exists(model_dir):
+        print(f"FATAL ERROR: Trained model not found at {model_dir}. Run ner_trainer.py first.")
+        return None
+    try:
+        eval_dataset = load_from_disk(os.path.join(DATA_DIR, 'eval.pt'))
+    except FileNotFoundError:
+        print(f"FATAL ERROR: eval.pt not found in {DATA_DIR}. Run data_processor.py first.")
+        return None
+
+    variants_dir = os.path.join(model_dir, VARIANTS_DIR_NAME)
+    os.makedirs(variants_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForTokenClassification.from_pretrained(model_dir).eval()
+
+    # 1. Build every variant as (predictor, files on disk)
+    weights_file = next(
+        os.path.join(model_dir, name) for name in ('model.safetensors', 'pytorch_model.bin')
+        if os.path.exists(os.path.join(model_dir, name))
+    )
+    variants = {"fp32": (torch_predictor(model), [weights_file])}
+
+    int8_dir = os.path.join(variants_dir, 'int8')
+    quantized = export_int8(model, tokenizer, int8_dir)
+    variants["int8"] = (torch_predictor(quantized), [os.path.join(int8_dir, 'model_int8.pt')])
+
+    if ort is not None:
+        onnx_path, onnx_int8_path = export_onnx(model, tokenizer, os.path.join(variants_dir, 'onnx'))
+        variants["onnx"] = (onnx_predictor(onnx_path), [onnx_path])
+        variants["onnx-int8"] = (onnx_predictor(onnx_int8_path), [onnx_int8_path])
+    else:
+        print("⚠️ onnxruntime not installed; skipping ONNX variants.")
+
+    # 2. Accuracy / size / latency per variant
+    results = {}
+    for name, (predict, files) in variants.items():
+        metrics = evaluate_variant(predict, eval_dataset, tokenizer)
+        results[name] = {
+            **{k: round(float(v), 4) for k, v in metrics.items()},
+            "size_mb": size_mb(*files),
+            **measure_latency(predict, eval_dataset),
+        }
+        print(f"Evaluated {name}: f1={results[name]['f1']}, size={results[name]['size_mb']} MB, "
+              f"p50={results[name]['latency_ms_p50']} ms")
+
+    # 3. Pick the fastest variant within the F1 tolerance of fp32
+    baseline_f1 = results["fp32"]["f1"]
+    for result in results.values():
+        result["f1_delta"] = round(result["f1"] - baseline_f1, 4)
+        result["within_tolerance"] = result["f1_delta"] >= -F1_TOLERANCE
+    recommended = min(
+        (name for name, result in results.items() if result["within_tolerance"]),
+        key=lambda name: results[name]["latency_ms_p50"],
+    )
+
+    report = {
+        "model_dir": model_dir,
+        "f1_tolerance": F1_TOLERANCE,
+        "recommended": recommended,
+        "variants": results,
+    }
+    with open(os.path.join(variants_dir, REPORT_FILE), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'variant':<12}{'f1':>8}{'Δf1':>9}{'size MB':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for name, result in results.items():
+        print(f"{name:<12}{result['f1']:>8.4f}{result['f1_delta']:>+9.4f}{result['size_mb']:>10.1f}"
+              f"{result['latency_ms_p50']:>9.2f}{result['latency_ms_p95']:>9.2f}")
+    print(f"✅ Recommended variant (fastest within ΔF1 ≤ {F1_TOLERANCE}): {recommended}")
+
+    # 4. Drop intermediate checkpoints that only duplicate the final weights
+    if PRUNE_CHECKPOINTS:
+        pruned = prune_checkpoints(model_dir)
+        if pruned:
+            print(f"🧹 Pruned checkpoints: {', '.join(pruned)}")
+    return report
+
+if __name__ == '__main__':
+    export_ner_model()
@@ -1,5 +1,6 @@
 import os
 import json
+import time
 from datasets import load_from_disk
 from transformers import (
     AutoTokenizer,
@@ -21,6 +22,31 @@ MODEL_CHECKPOINT = "distilbert-base-uncased"
 DATA_DIR = r"C:\Users\Sameer Roy\Desktop\nsac\data\data"  # Folder containing labels.json, train.pt, eval.pt
 OUTPUT_MODEL_DIR = './models/ner_v1_15papers'  # Where the trained model will be saved
 
+# Training performance profile: "basic" (original settings) or "throughput" (CPU-optimized)
+TRAINING_PROFILE = os.getenv('NER_TRAINING_PROFILE', 'basic')
+TRAINING_PROFILES = {
+    "basic": {
+        "batch_size": 16,
+        "gradient_accumulation_steps": 1,
+        "group_by_length": False,
+        "dataloader_num_workers": 0,
+        "pad_to_multiple_of": None,
+        "bf16_on_cpu": False,
+        "intra_op_threads": None,  # None keeps torch's default
+        "inter_op_threads": None,
+    },
+    "throughput": {
+        "batch_size": int(os.getenv('NER_BATCH_SIZE', '32')),
+        "gradient_accumulation_steps": int(os.getenv('NER_GRAD_ACCUM_STEPS', '1')),
+        "group_by_length": True,   # length-bucketed batches -> far less padding
+        "dataloader_num_workers": int(os.getenv('NER_DATALOADER_WORKERS', '2')),
+        "pad_to_multiple_of": 8,   # dynamic padding, rounded for better vectorized kernels
+        "bf16_on_cpu": os.getenv('NER_BF16_CPU', '0') == '1',
+        "intra_op_threads": int(os.getenv('NER_INTRA_OP_THREADS', os.cpu_count() or 1)),
+        "inter_op_threads": int(os.getenv('NER_INTER_OP_THREADS', '1')),
+    },
+}
+
 # Load the label mapping created in the data_processor.py script
 try:
     with open(os.path.join(DATA_DIR, 'labels.json'), 'r') as f:
@@ -56,34 +82,124 @@ def compute_metrics(eval_preds):
     }
 
 # --- TrainingArguments helper ---
-def get_training_args():
+def get_training_args(profile=None):
     """
     Builds TrainingArguments using the most basic, universally supported arguments.
     
     This avoids arguments like 'evaluation_strategy', 'save_strategy', and 
     'load_best_model_at_end' that cause TypeErrors in older transformers versions.
+    The batching/precision/worker settings come from the selected training profile.
     """
     # Note: We are using a basic configuration to prevent the TypeError.
     # To re-enable features like automatic per-epoch evaluation, you must update 
     # your 'transformers' library to version 4.30 or newer.
-    
+    profile = profile or TRAINING_PROFILES[TRAINING_PROFILE]
     has_cuda = torch and torch.cuda.is_available()
 
-    print(f"🛠️ Using basic TrainingArguments configuration to bypass TypeError.")
+    print(f"🛠️ Using basic TrainingArguments configuration to bypass TypeError (profile: {TRAINING_PROFILE}).")
     return TrainingArguments(
         output_dir=OUTPUT_MODEL_DIR,
         learning_rate=2e-5,
-        per_device_train_batch_size=16,
-        per_device_eval_batch_size=16,
+        per_device_train_batch_size=profile["batch_size"],
+        per_device_eval_batch_size=profile["batch_size"],
+        gradient_accumulation_steps=profile["gradient_accumulation_steps"],
+        group_by_length=profile["group_by_length"],
+        length_column_name="length",
+        dataloader_num_workers=profile["dataloader_num_workers"],
         num_train_epochs=3,
         weight_decay=0.01,
         # Using basic logging/save steps for compatibility
         logging_steps=500,
         save_steps=500,
         fp16=has_cuda,
+        bf16=bool(not has_cuda and profile["bf16_on_cpu"]),  # CPU autocast in bf16
         report_to="none"
     )
 
+def configure_torch_threads(profile):
+    """Applies the profile's torch intra-op / inter-op thread counts (must run before training starts)."""
+    if torch is None:
+        return
+    if profile["intra_op_threads"]:
+        torch.set_num_threads(profile["intra_op_threads"])
+    if profile["inter_op_threads"]:
+        try:
+            torch.set_num_interop_threads(profile["inter_op_threads"])
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            print("⚠️ torch inter-op threads already initialized; keeping the current setting.")
+    print(f"Torch threads: intra-op={torch.get_num_threads()}, inter-op={torch.get_num_interop_threads()}")
+
+def add_length_column(dataset):
+    """Precomputes sequence lengths so length-grouped sampling does not re-scan every example."""
+    if "length" in dataset.column_names:
+        return dataset
+    return dataset.map(lambda batch: {"length": [len(ids) for ids in batch["input_ids"]]}, batched=True)
+
+# --- Throughput Instrumentation ---
+class ThroughputTrainer(Trainer):
+    """
+    Trainer that records the wall time of every optimizer step and the number of real
+    (non-padding) and padded tokens it processed, so configurations can be compared
+    on the same data. training_step() runs once per micro-batch; with gradient
+    accumulation the micro-batches of one optimizer step are summed into that step.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.step_times = {}  # optimizer step -> forward/backward seconds summed over its micro-batches
+        self.micro_batches = 0
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self._window_start = None
+        self._window_tokens = 0
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        start = time.perf_counter()
+        if self._window_start is None:
+            self._window_start = start
+        loss = super().training_step(model, inputs, *args, **kwargs)
+        # global_step only advances after the optimizer step, so it groups the micro-batches
+        step = self.state.global_step
+        self.step_times[step] = self.step_times.get(step, 0.0) + time.perf_counter() - start
+        self.micro_batches += 1
+
+        mask = inputs.get("attention_mask")
+        if mask is not None:
+            tokens = int(mask.sum())
+            self.real_tokens += tokens
+            self.padded_tokens += mask.numel()
+            self._window_tokens += tokens
+        return loss
+
+    def log(self, logs, *args, **kwargs):
+        # Add throughput since the previous log line to the regular training logs
+        if self._window_start is not None and "loss" in logs:
+            elapsed = time.perf_counter() - self._window_start
+            logs["tokens_per_second"] = round(self._window_tokens / max(elapsed, 1e-9), 1)
+            recent = list(self.step_times.values())[-50:]
+            logs["mean_step_seconds"] = round(sum(recent) / len(recent), 4)
+            self._window_start = time.perf_counter()
+            self._window_tokens = 0
+        super().log(logs, *args, **kwargs)
+
+    def throughput_report(self, train_runtime, profile_name, profile):
+        """Throughput summary of the run, labelled with the profile it was trained with."""
+        step_times = sorted(self.step_times.values())
+        count = len(step_times)
+        return {
+            "profile": profile_name,
+            "settings": profile,
+            "steps": count,
+            "micro_batches": self.micro_batches,
+            "train_runtime_seconds": round(train_runtime, 2),
+            "real_tokens": self.real_tokens,
+            "tokens_per_second": round(self.real_tokens / max(train_runtime, 1e-9), 1),
+            "padding_efficiency": round(self.real_tokens / max(self.padded_tokens, 1), 3),
+            "step_seconds_p50": round(step_times[count // 2], 4) if count else None,
+            "step_seconds_p95": round(step_times[min(count - 1, int(count * 0.95))], 4) if count else None,
+        }
+
 # --- Main Training Function ---
 def train_ner_model():
     print("--- Phase II, Step 4: Model Training Started ---")
@@ -97,6 +213,11 @@ def train_ner_model():
         print(f"FATAL ERROR: Training files not found in {DATA_DIR}. Run data_processor.py first.")
         return
 
+    profile = TRAINING_PROFILES[TRAINING_PROFILE]
+    configure_torch_threads(profile)
+    if profile["group_by_length"]:
+        train_dataset = add_length_column(train_dataset)
+
     # 2. Load Tokenizer and Model
     tokenizer = AutoTokenizer.from_pretrained(MODEL_CHECKPOINT)
     model = AutoModelForTokenClassification.from_pretrained(
@@ -108,13 +229,15 @@ def train_ner_model():
     print(f"Model {MODEL_CHECKPOINT} loaded with {NUM_LABELS} labels.")
 
     # 3. Define Training Arguments (version-safe)
-    training_args = get_training_args()
+    training_args = get_training_args(profile)
 
-    # 4. Data Collator
-    data_collator = DataCollatorForTokenClassification(tokenizer=tokenizer)
+    # 4. Data Collator (pads each batch dynamically to its longest sequence)
+    data_collator = DataCollatorForTokenClassification(
+        tokenizer=tokenizer, pad_to_multiple_of=profile["pad_to_multiple_of"]
+    )
 
     # 5. Initialize Trainer
-    trainer = Trainer(
+    trainer = ThroughputTrainer(
         model=model,
         args=training_args,
         train_dataset=train_dataset,
@@ -126,7 +249,14 @@ def train_ner_model():
 
     # 6. Train
     print("Starting training...")
-    trainer.train()
+    train_result = trainer.train()
+
+    report = trainer.throughput_report(train_result.metrics.get("train_runtime", 0.0), TRAINING_PROFILE, profile)
+    print(f"⏱️ Throughput: {report['tokens_per_second']} tokens/s, "
+          f"step p50={report['step_seconds_p50']}s p95={report['step_seconds_p95']}s, "
+          f"padding efficiency={report['padding_efficiency']}")
+    with open(os.path.join(OUTPUT_MODEL_DIR, f"throughput_{TRAINING_PROFILE}.json"), 'w') as f:
+        json.dump(report, f, indent=2)
 
     # 7. Save final model
     trainer.save_model(OUTPUT_MODEL_DIR)
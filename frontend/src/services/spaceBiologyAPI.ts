@@ -21,11 +21,62 @@ export interface APIResponse {
   knowledge_graph_data: Record<string, any>;
 }
 
+// An answer sentence and the part of a citation's text that best supports it
+export interface EvidenceSpan {
+  answer_start: number; // char offsets into APIResponse.answer
+  answer_end: number;
+  text_start: number; // char offsets into Citation.text
+  text_end: number;
+  similarity: number; // cosine similarity of the two sentences
+  marker_verified: boolean | null; // is the sentence supported by the chunk its [ID n] marker cites (null: no marker)
+}
+
 export interface Citation {
   source: string;
   filename: string;
   chunk_index: number;
   text: string;
+  spans?: EvidenceSpan[];
+}
+
+export interface GraphTileManifest {
+  version: string;
+  max_zoom: number;
+  max_nodes_per_tile: number;
+  max_edges_per_tile: number;
+  node_count: number;
+  edge_count: number;
+  zooms: Record<
+    string,
+    {
+      tiles_per_axis: number;
+      visible_nodes: number;
+      tiles: [number, number, number, number][]; // [x, y, nodeCount, edgeCount]
+    }
+  >;
+}
+
+export interface GraphTile {
+  z: number;
+  x: number;
+  y: number;
+  nodes: {
+    id: string;
+    label: string;
+    type: string | null;
+    x: number; // normalized layout coordinates in [0, 1]
+    y: number;
+    weight: number;
+  }[];
+  edges: { source: string; target: string; weight: number; label: string }[];
+}
+
+// Visible region of the graph in normalized [0, 1] layout coordinates
+export interface GraphViewport {
+  minX: number;
+  minY: number;
+  maxX: number;
+  maxY: number;
 }
 
 class SpaceBiologyAPI {
@@ -87,6 +138,51 @@ class SpaceBiologyAPI {
     }
   }
 
+  /**
+   * Get the manifest of precomputed knowledge graph layout tiles
+   */
+  async getGraphTileManifest(): Promise<GraphTileManifest> {
+    const response = await fetch(`${this.baseURL}/kg/tiles`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+  }
+
+  /**
+   * Fetch only the knowledge graph tiles intersecting the viewport at a zoom level.
+   * The browser cache revalidates unchanged tiles via their ETag.
+   */
+  async getGraphTiles(
+    manifest: GraphTileManifest,
+    zoom: number,
+    viewport: GraphViewport
+  ): Promise<GraphTile[]> {
+    const z = Math.max(0, Math.min(manifest.max_zoom, Math.floor(zoom)));
+    const level = manifest.zooms[String(z)];
+    if (!level) return [];
+
+    const toTile = (v: number) =>
+      Math.max(0, Math.min(level.tiles_per_axis - 1, Math.floor(v * level.tiles_per_axis)));
+    const [x0, x1] = [toTile(viewport.minX), toTile(viewport.maxX)];
+    const [y0, y1] = [toTile(viewport.minY), toTile(viewport.maxY)];
+
+    // Skip regions the manifest lists as empty
+    const inView = level.tiles.filter(
+      ([x, y]) => x >= x0 && x <= x1 && y >= y0 && y <= y1
+    );
+
+    return Promise.all(
+      inView.map(async ([x, y]) => {
+        const response = await fetch(`${this.baseURL}/kg/tiles/${z}/${x}/${y}`);
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json() as Promise<GraphTile>;
+      })
+    );
+  }
+
   /**
    * Get available domains from the backend
    */